@@ -12,5 +12,13 @@ def test_new_config():
     config = load_config(config_path)
     config_path.unlink()    # Clean up
 
+def test_save_load_config():
+    new_config(config_path, '.')
+    config = load_config(config_path)
+    config = set_yt("single", "https://www.youtube.com/watch?v=6NQHtVrP3gE", config, {"name": "test", "resolution": "720p"})
+    save_config(config_path, config)
+    assert load_config(config_path) == config   # Whatever we save should load back the same
+    config_path.unlink()    # Clean up
+
 if __name__ == "__main__":
     test_new_config()
\ No newline at end of file
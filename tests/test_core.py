@@ -43,10 +43,34 @@ def test_add_sync_remove_single():
     except Exception as e:
         pytest.fail("Failed due to %s", e)
 
+def test_load_options_keeps_defaults():
+    '''
+    Verifies loading options with overrides doesn't leak into the defaults
+    '''
+    options = ym.load_options(dl_thumbnail=True, resolution=None)
+    assert options["dl_thumbnail"] == True                       # The override is applied
+    assert options["resolution"] is not None                     # None doesn't override
+    assert configurer.defaults["dl_thumbnail"] == False          # But the defaults are untouched
+    assert ym.load_options()["dl_thumbnail"] == ym.config["youmirror"].get("dl_thumbnail", False)
+
+def test_fetch_children_retries_unknown(monkeypatch):
+    '''
+    Verifies children whose availability couldn't be checked get checked again
+    '''
+    answers = {"a": [None, True], "b": [False]}          # What each check returns, in order
+    def get_metadata(yt):
+        return {"name": yt, "id": yt, "available": answers[yt].pop(0)}
+    monkeypatch.setattr(core.tuber, "get_metadata", get_metadata)
+    monkeypatch.setattr(ym, "get_pytube", lambda url, url_type=None: url)
+    fetched = ym.fetch_children(["a", "b"])
+    assert fetched["a"][1]["available"] == True         # Unknown the first time, checked again
+    assert fetched["b"][1]["available"] == False        # Youtube already said no, not asked again
+
 # Cleanup
 def test_cleanup():
     '''
     Cleanup
     '''
+    databaser.close_all()                       # Close the tables we kept open
     Path(databaser.db_file).unlink()
     Path(configurer.config_file).unlink()
@@ -0,0 +1,150 @@
+import pytest
+from youmirror.databaser import *
+from pathlib import Path
+from sqlitedict import SqliteDict
+from contextlib import closing
+import sqlite3
+
+db_path = Path("./testdb.db")
+
+def test_new_database():
+    new_database(db_path)
+    assert db_path.is_file()
+    with closing(sqlite3.connect(db_path)) as conn:     # sqlitedict's get_tablenames leaves its connection open
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert names == valid_tables
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_open_tables():
+    new_database(db_path)
+    with open_tables(db_path, "single", "files") as tables:
+        set_entries({"a": {"name": "a"}, "b": {"name": "b"}}, tables["single"])
+    with open_tables(db_path, "single") as tables:
+        assert get_entry("a", tables["single"]) == {"name": "a"}
+        assert remove_entry("a", tables["single"])
+        assert "a" not in tables["single"]
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_set_entry():
+    new_database(db_path)
+    with open_tables(db_path, "single") as tables:
+        set_entry("a", {"name": "a"}, tables["single"])
+        assert tables["single"]["a"] == {"name": "a"}       # Plain reads see it straight away
+    forget_tables(db_path)
+    with open_tables(db_path, "single") as tables:          # Even from a new handle
+        assert get_entry("a", tables["single"]) == {"name": "a"}
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_reuse_tables():
+    new_database(db_path)
+    with open_tables(db_path, "files") as tables:
+        first = tables["files"]
+    with open_tables(db_path, "files") as tables:
+        assert tables["files"] is first                     # Same handle the second time around
+    forget_tables(db_path)
+    db_path.unlink()
+    new_database(db_path)
+    with open_tables(db_path, "files") as tables:
+        assert tables["files"] is not first                 # New database, new handle
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_files_table():
+    old = SqliteDict(db_path, tablename="files")               # Files used to be a sqlitedict table
+    old["a/b.mp4"] = {"type": "video", "parent": "url", "downloaded": False}
+    old.commit()
+    old.close()
+    with open_tables(db_path, "files") as tables:
+        files = tables["files"]
+        assert files["a/b.mp4"] == {"type": "video", "parent": "url", "downloaded": False}  # Moved over to the new table
+        files["a/c.srt"] = {"type": "caption", "language": "en", "parent": "url", "downloaded": True}
+        assert set(files.by_parent("url")) == {"a/b.mp4", "a/c.srt"}
+        assert files.by_parent("other") == {}
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_paths_table():
+    old = SqliteDict(db_path, tablename="paths")
+    old["singles/a"] = {"parent": "url"}
+    old.commit()
+    old.close()
+    with open_tables(db_path, "paths") as tables:
+        paths = tables["paths"]
+        assert paths["singles/a"] == {"parent": "url"}     # No size yet, so it doesn't come back
+        paths["singles/b"] = {"parent": "url", "size": 10}
+        assert paths.by_parent("url")["singles/b"] == {"parent": "url", "size": 10}
+        assert add_path_sizes({"singles/a": 5, "singles/b": 5, "missing": 5}, paths) == 3
+        assert paths["singles/a"]["size"] == 5 and paths["singles/b"]["size"] == 15
+        assert remove_entries(["singles/a"], paths) == 1
+        assert "singles/a" not in paths
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_file_write_batch():
+    new_database(db_path)
+    with open_tables(db_path, "files") as tables:
+        with FileWriteBatch(tables["files"], size=2) as batch:
+            batch["a"] = {"type": "video"}
+            assert "a" not in tables["files"]                   # Waiting for the batch to fill up
+            batch["b"] = {"type": "video"}
+            assert "a" in tables["files"]                       # Batch was full, so it got saved
+            batch["c"] = {"type": "audio"}
+            batch["c"] = {"type": "video"}                      # Only the last one gets written
+        assert set(tables["files"].keys()) == {"a", "b", "c"}   # The rest is saved at the end
+        assert tables["files"]["c"] == {"type": "video"}
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_remove_entries():
+    new_database(db_path)
+    with open_tables(db_path, "files") as tables:
+        set_entries({"a": {}, "b": {}, "c": {}}, tables["files"])
+        assert remove_entries(["a", "b", "missing"], tables["files"]) == 3
+        assert list(tables["files"].keys()) == ["c"]
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_remove_expired():
+    new_database(db_path)
+    with open_tables(db_path, "vid_info") as tables:
+        set_entries({"old": {"expires": 100, "js_url": "a.js", "data": b"x"}, "new": {"expires": 300, "data": b"y"}}, tables["vid_info"])
+        assert remove_expired(200, tables["vid_info"]) == 1
+        assert tables["vid_info"]["new"] == {"expires": 300, "data": b"y"}
+        assert "old" not in tables["vid_info"]
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_list_all():
+    new_database(db_path)
+    with open_tables(db_path, "playlist", "single") as tables:
+        set_entries({"pl": {"name": "list"}}, tables["playlist"])
+        set_entries({"a": {"name": "a", "parent_type": "single"}, "b": {"name": "b", "parent_type": "playlist"}}, tables["single"])
+    assert list_all(db_path) == [("playlist", "list", "pl"), ("single", "a", "a")]  # Children of the playlist are left out
+    with open_tables(db_path, "playlist") as tables:
+        set_entries({"aa": {"name": "first"}}, tables["playlist"])
+        set_entries({"pl": {"name": "list"}}, tables["playlist"])      # Rewriting it doesn't move it
+    assert list_all(db_path)[:2] == [("playlist", "first", "aa"), ("playlist", "list", "pl")]
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+def test_list_all_missing_tables():
+    with open_tables(db_path, "single") as tables:                      # Only singles were ever added
+        set_entries({"a": {"name": "a", "parent_type": "single"}}, tables["single"])
+    assert list_all(db_path) == [("single", "a", "a")]
+    forget_tables(db_path)  # Close the tables we kept open
+    db_path.unlink()    # Clean up
+
+if __name__ == "__main__":
+    test_new_database()
+    test_open_tables()
+    test_set_entry()
+    test_reuse_tables()
+    test_files_table()
+    test_file_write_batch()
+    test_remove_entries()
+    test_remove_expired()
+    test_list_all()
+    test_list_all_missing_tables()
@@ -0,0 +1,45 @@
+import pytest
+import threading
+import time
+from youmirror import downloader
+
+def test_download_many_groups_videos(monkeypatch):
+    running = dict()        # How many downloads are going at once for each video
+    threads = dict()        # Which threads downloaded each video
+    lock = threading.Lock()
+    def fake_download(yt, file_type, filepath, options, path=None):
+        with lock:
+            running[yt] = running.get(yt, 0) + 1
+            assert running[yt] == 1                         # Never two at once for one video
+            threads.setdefault(yt, set()).add(threading.get_ident())
+        with lock:
+            running[yt] -= 1
+        return {"downloaded": True}
+    monkeypatch.setattr(downloader, "download_single", fake_download)
+    jobs = [(f"{yt}/{file_type}", yt, file_type, f"{yt}/{file_type}", {}, None) for yt in ("a", "b", "c") for file_type in ("video", "audio", "thumbnail")]
+    results = dict(downloader.download_many(jobs, max_workers=4))
+    assert set(results) == {job[0] for job in jobs}
+    assert all(len(used) == 1 for used in threads.values())   # Each video stayed on one thread
+
+def test_download_many_stops_early(monkeypatch):
+    started = []
+    def fake_download(yt, file_type, filepath, options, path=None):
+        started.append(yt)
+        time.sleep(0.05)                                    # Long enough for the generator to be closed mid download
+        return {"downloaded": True}
+    monkeypatch.setattr(downloader, "download_single", fake_download)
+    jobs = [(yt, yt, "video", yt, {}, None) for yt in "abcdefgh"]
+    results = downloader.download_many(jobs, max_workers=1)
+    next(results)
+    results.close()                                         # Like a ctrl-c in the middle of a sync
+    assert len(started) <= 2                                # Only the one already going when we stopped finished, the rest never started
+
+def test_calculate_filesizes_keeps_order(monkeypatch):
+    threads = dict()
+    def fake_filesize(yt, file_type, options):
+        threads.setdefault(yt, set()).add(threading.get_ident())
+        return len(yt) * 10 + len(file_type)
+    monkeypatch.setattr(downloader, "calculate_filesize", fake_filesize)
+    items = [("a", "video"), ("bb", "video"), ("a", "audio"), ("bb", "thumbnail")]
+    assert downloader.calculate_filesizes(items, {}) == [15, 25, 15, 29]
+    assert all(len(used) == 1 for used in threads.values())   # Each video stayed on one thread
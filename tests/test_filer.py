@@ -0,0 +1,62 @@
+import pytest
+from youmirror.filer import *
+import os
+
+def test_file_exists(tmp_path):
+    filepath = tmp_path/"video.mp4"
+    assert not file_exists(filepath)
+    create_file(filepath)
+    assert file_exists(filepath)                    # Creating the file forgets the old listing
+    clear_dir_cache()
+
+def test_create_path(tmp_path):
+    path = tmp_path/"a"/"b"
+    create_path(path)
+    assert path.is_dir()
+    assert str(tmp_path/"a") in created_dirs       # Its parents count as made too
+    path.rmdir()
+    create_path(path)
+    assert not path.is_dir()                        # Remembered, so it didn't check again
+    clear_dir_cache()
+    create_path(path)
+    assert path.is_dir()
+    clear_dir_cache()
+
+def test_verify_installation_batch(tmp_path):
+    create_file(tmp_path/"a.mp4")
+    filepaths = [tmp_path/"a.mp4", tmp_path/"b.mp4", tmp_path/"missing"/"c.mp4"]
+    assert verify_installation_batch(filepaths) == {filepaths[0]: True, filepaths[1]: False, filepaths[2]: False}
+    assert verify_installation(tmp_path/"a.mp4")
+    clear_dir_cache()
+
+def test_calculate_filename():
+    assert calculate_filename("video", "my video") == "my_video.mp4"
+    assert calculate_filename("audio", "my video") == "my_video_audio.mp4"
+    assert calculate_filename("nope", "my video") is None
+
+def test_get_files():
+    options = {"dl_video": True, "dl_audio": False, "dl_captions": True, "dl_thumbnail": True, "captions": ["en", "a.en"]}
+    files = get_files(os.path.join("singles", "my_video"), "my video", options)
+    assert files == {
+        os.path.join("singles", "my_video", "my_video.mp4"): {"type": "video"},
+        os.path.join("singles", "my_video", "my_video_en.srt"): {"type": "caption", "language": "en"},
+        os.path.join("singles", "my_video", "my_video_aen.srt"): {"type": "caption", "language": "a.en"},
+        os.path.join("singles", "my_video", "my_video.jpg"): {"type": "thumbnail"},
+    }
+
+def test_safe_name():
+    from pytube.helpers import safe_filename
+    for name in ["my video", 'a "quoted" title?', "50% off: now/then", "tab\there.", "~weird|name*<>", "x" * 300]:
+        assert safe_name(name) == safe_filename(name).replace(' ', '_')    # Matches what we used to do
+
+def test_resolve_collision():
+    taken = {"singles/my_video", "singles/my_video/my_video.mp4"}
+    assert resolve_collision("singles/other", taken, "abc") == "singles/other"
+    assert resolve_collision("singles/my_video", taken, "abc") == "singles/my_video_abc"
+    assert resolve_collision("singles/my_video/my_video.mp4", taken, "abc") == "singles/my_video/my_video_abc.mp4"
+
+def test_calculate_path():
+    assert calculate_path("channel", "my channel", "") == os.path.join("channels", "my_channel")
+    assert calculate_path("single", "", "my video") == os.path.join("singles", "my_video")
+    assert calculate_path("playlist", "list", "my video") == os.path.join("playlists", "list", "my_video")
+    assert calculate_path("nope", "list", "my video") is None
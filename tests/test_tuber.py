@@ -0,0 +1,93 @@
+import pytest
+from youmirror.tuber import *
+from pytube import YouTube
+from copy import deepcopy
+import pytube
+import time
+
+url = "https://www.youtube.com/watch?v=6NQHtVrP3gE"
+
+def test_pack_vid_info():
+    yt = SavingYouTube(url)
+    yt._js_url = "player.js"                        # Don't ask youtube for the watch page
+    assert pack_vid_info(yt) is None                # Nothing fetched yet, so nothing to save
+    yt.raw_vid_info = {"streamingData": {"expiresInSeconds": "21540"}, "videoDetails": {"title": "test"}}
+    yt.fetched = time.time()
+    packed = pack_vid_info(yt)
+    assert packed["js_url"] == "player.js"
+
+    fresh = SavingYouTube(url)
+    fresh._js_url = "player.js"
+    assert offer_vid_info(fresh, packed)
+    assert fresh.title == "test"                    # pytube reads from the saved response
+    assert used_saved_vid_info(fresh)
+    assert pack_vid_info(fresh) is None             # Nothing new to save
+
+    moved = SavingYouTube(url)
+    moved._js_url = "new_player.js"                 # Youtube moved to a new player
+    assert not unpack_vid_info(moved, packed)
+
+    packed["expires"] = 0                           # Stream urls ran out
+    assert not unpack_vid_info(SavingYouTube(url), packed)
+
+def test_raw_vid_info_kept(monkeypatch):
+    response = {"streamingData": {"formats": [{"signatureCipher": "s=abc&url=x"}]}}
+    class FakeInnerTube:
+        def __init__(self, *args, **kwargs):
+            pass
+        def player(self, video_id):
+            return deepcopy(response)
+    monkeypatch.setattr(pytube.__main__, "InnerTube", FakeInnerTube)
+    yt = SavingYouTube(url)
+    yt.vid_info["streamingData"]["formats"][0]["url"] = "x&sig=deciphered"   # Like pytube building streams
+    assert yt.raw_vid_info == response              # The copy we save is untouched
+    assert yt.fetched is not None
+
+def test_vid_info_expiry():
+    yt = SavingYouTube(url)
+    yt._js_url = "player.js"
+    yt.raw_vid_info = {"streamingData": {"expiresInSeconds": "21540", "adaptiveFormats": [
+        {"signatureCipher": "s=abc&sp=sig&url=https%3A%2F%2Fr1.googlevideo.com%2Fvideoplayback%3Fexpire%3D1700000000%26id%3D1"}]}}
+    assert pack_vid_info(yt)["expires"] == 1700000000   # Read off the stream url, not counted from now
+    assert vid_info_expired(pack_vid_info(yt))
+
+    yt.raw_vid_info = {"streamingData": {"expiresInSeconds": "21540"}}
+    yt.fetched = 1000
+    assert pack_vid_info(yt)["expires"] == 22540        # Counted from when it was fetched
+    yt.fetched = time.time()
+    assert not vid_info_expired(pack_vid_info(yt))
+
+def test_link_type():
+    assert link_type("https://www.youtube.com/c/somebody") == "channel"
+    assert link_type("https://www.youtube.com/playlist?list=PL123") == "playlist"
+    assert link_type(url) == "single"
+    assert link_type("https://example.com") is None
+
+def test_is_available(monkeypatch):
+    from pytube.exceptions import VideoPrivate
+    from urllib.error import URLError
+    yt = YouTube(url)
+    monkeypatch.setattr(yt, "check_availability", lambda: None)
+    assert is_available(yt) is True
+    def private():
+        raise VideoPrivate(yt.video_id)
+    monkeypatch.setattr(yt, "check_availability", private)
+    assert is_available(yt) is False                # Youtube said no
+    def offline():
+        raise URLError("offline")
+    monkeypatch.setattr(yt, "check_availability", offline)
+    assert is_available(yt) is None                 # Couldn't tell
+    def broken():
+        raise KeyError("playabilityStatus")
+    monkeypatch.setattr(yt, "check_availability", broken)
+    with pytest.raises(KeyError):                   # Not a network problem, don't hide it
+        is_available(yt)
+    monkeypatch.setattr(YouTube, "title", "test")   # Don't ask youtube for the title
+    assert get_metadata_batch([yt]) == [None]       # The batch logs it and skips the video
+    monkeypatch.setattr(yt, "check_availability", offline)
+    assert get_metadata_batch([yt]) == [{"name": "test", "id": yt.video_id, "available": None}]
+
+if __name__ == "__main__":
+    test_pack_vid_info()
+    test_vid_info_expiry()
+    test_link_type()
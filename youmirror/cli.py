@@ -1,6 +1,6 @@
 import typer
 from typing import Optional
-from youmirror.core import YouMirror
+# YouMirror is imported inside each command so things like --help don't pay for loading pytube
 
 app = typer.Typer(help="Create a mirror of your favorite youtube videos", add_completion=True)
 
@@ -13,12 +13,14 @@ def sync(
     url: str = typer.Argument(None, help="Specify the url to sync"),
     mirror: str = typer.Option('./', *('-m', '--mirror'), help="The mirror directory to sync"),
     update: bool = typer.Option(False, '--update', help="Update the database before syncing"),
+    jobs: Optional[int] = typer.Option(None, *('-j', '--jobs'), help="How many files to download at once"),
     # dry_run : Optional[bool] = typer.Option(default=False, show_choices=False, help="Calculates changes with no execution"),
     ):
     '''
     Downloads videos to match the mirror
     '''
-    kwargs = {"update": update}
+    from youmirror.core import YouMirror
+    kwargs = {"update": update, "jobs": jobs}
     ym = YouMirror(root=mirror)
     ym.sync(url=url, **kwargs)
     return
@@ -28,6 +30,7 @@ def new(root : str = typer.Argument('.', help="The directory to create the mirro
     '''
     Create a new mirror in the given directory [default:'./']
     '''
+    from youmirror.core import YouMirror
     ym = YouMirror(root=root)
     ym.new()
     return
@@ -42,16 +45,18 @@ def add(
     audio: Optional[bool] = typer.Option(None, "--audio", show_default=True, help='Download audio separately'),
     thumbnail: Optional[bool] = typer.Option(None, "--thumbnail", show_default=True, help='Download thumbnail'),
     force : Optional[bool] = typer.Option(False, *("-f", "--force"), help='Force download without asking confirmation'),
+    jobs: Optional[int] = typer.Option(None, *('-j', '--jobs'), help="How many files to download at once"),
     # dry_run : Optional[bool] = typer.Option(False, "--dry-run", help="Calculates changes with no execution"),
     no_dl : Optional[bool] = typer.Option(False, "--no-dl", help='Adds the url to the mirror without downloading')
     ):
     '''
     Adds the url to the mirror and downloads videos
     '''
+    from youmirror.core import YouMirror
     video = None
     if no_video:    # Initializing dl_video
         video = not no_video
-    kwargs = {"resolution": resolution, "dl_video": video, "dl_captions": captions, "dl_audio": audio, "dl_thumbnail": thumbnail, "force": force, "dry_run": '', "no_dl": no_dl}
+    kwargs = {"resolution": resolution, "dl_video": video, "dl_captions": captions, "dl_audio": audio, "dl_thumbnail": thumbnail, "force": force, "dry_run": '', "no_dl": no_dl, "jobs": jobs}
     ym = YouMirror(root=mirror)
     ym.add(url, **kwargs)
     return
@@ -65,6 +70,7 @@ def remove(
     '''
     Removes the url from the mirror and deletes all files
     '''    
+    from youmirror.core import YouMirror
     kwargs = {"no_rm": no_rm}
     ym = YouMirror(root=mirror)
     ym.remove(url, **kwargs)
@@ -86,6 +92,7 @@ def update(
     '''
     Updates the mirror when new videos are available
     '''
+    from youmirror.core import YouMirror
     kwargs = {"sync": sync}
     ym = YouMirror(root=mirror)
     ym.update(url=url, **kwargs)
@@ -98,6 +105,7 @@ def show(
     '''
     Shows the state of the mirror
     '''
+    from youmirror.core import YouMirror
     ym = YouMirror(root=mirror)
     ym.show()
 
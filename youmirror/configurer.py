@@ -11,11 +11,19 @@ ids     - YouTube specific ids (keys)
 '''
 import toml
 import logging
+try:                                    # Prefer the faster parser for loading if we have it
+    import tomllib as toml_loader       # Builtin from python 3.11
+except ImportError:
+    try:
+        import tomli as toml_loader     # Same parser as a package
+    except ImportError:
+        toml_loader = None              # Fall back to toml
 from datetime import datetime
 from pathlib import Path
 from copy import deepcopy
+from types import MappingProxyType
 
-defaults = {                # These are the default global configs if not specified
+defaults = MappingProxyType({   # These are the default global configs if not specified (read-only)
     "dry_run": False,       # Dry run means don't download automatically
     "resolution": "720p",   # Default video resolution
     "locked":False,         # Make no changes to the item
@@ -23,8 +31,9 @@ defaults = {                # These are the default global configs if not specif
     "dl_captions": False,   # Whether to download captions
     "dl_audio": False,      # Whether to download audio
     "dl_thumbnail": False,  # Whether to download the thumbnail
+    "jobs": 8,              # How many files to download at once
     "captions": ["en", "a.en"]  # Which caption types to check for
-}
+})
 
 config_file = "youmirror.toml"                                      # This is the name for the config file to be used
 valid_options = {"youmirror", "channel", "playlist", "single"}      # These are the valid global options
@@ -35,8 +44,7 @@ def get_globals(config: dict) -> dict:
     '''
     Gets the options for the given config parameter
     '''
-    config = deepcopy(config)   # Copy the config
-    settings = config["youmirror"]
+    settings = deepcopy(config["youmirror"])    # Only copy the section we hand back
     return settings
 
 def set_globals(config: dict, settings: dict) -> dict:
@@ -106,7 +114,12 @@ def load_config(config_path: str) -> dict:
     '''
     try:
         if Path(config_path).is_file():
-            config = toml.load(open(config_path))   # Dictionary from the config file
+            if toml_loader:
+                with open(config_path, 'rb') as f:
+                    config = toml_loader.load(f)    # Dictionary from the config file
+            else:
+                with open(config_path) as f:
+                    config = toml.load(f)           # Dictionary from the config file
             return config
         else:
             return None
@@ -120,7 +133,8 @@ def save_config(config_path: Path, config: dict) -> Path:
     try:
         if config_path.is_file():                      # Check if the file exists     
             toml_string = toml.dumps(config)           # Convert the config to a toml string
-            config_path.open('w').write(toml_string)   # Write the toml string to the config file
+            with config_path.open('w') as f:
+                f.write(toml_string)                   # Write the toml string to the config file
         else:
             logging.error(f"Config file {config_path} does not exist")
             return None
@@ -2,10 +2,12 @@
 from pathlib import Path    # Helpful for ensuring text inputs translate well to real directories
 from datetime import datetime   # For marking dates
 import shutil               # For removing whole directories    
-from copy import deepcopy   # For deep copying dictionaries
+from collections import ChainMap    # For checking collisions against several dicts at once
 import os                   # For calculating directory sizes
 import logging              # Logging
+import time                 # For throwing out saved player responses that ran out
 from typing import Union    # For typing
+from functools import lru_cache # For caching
 
 #Youmirror stuff
 import youmirror.downloader as downloader   # Does the downloading
@@ -16,17 +18,21 @@ import youmirror.filer as filer             # Manages the filetree
 import youmirror.tuber as tuber             # Manages pytube objects
 
 #Pytube
-from pytube.helpers import safe_filename    # For making good paths & filenames
 from pytube import YouTube, Channel, Playlist   # Used for lots of stuff
 
 '''
 This is the core module
 ------
-# TODO I think some asyncio could be implemented here when collecting data
-from the videos and waiting for youtube to respond. There might be other async
-optimizations with downloading too
+Collecting data from the videos is mostly waiting for youtube to respond, so
+children are fetched concurrently in threads (tuber.get_metadata_batch). Downloads
+run in threads too
 '''
 
+max_fetches = 16    # Max concurrent requests to youtube when collecting data
+yt_strings = ("channel", "playlist", "single")  # Every youtube type, in the order we go through them
+parent_strings = ("channel", "playlist")        # Youtube types that have children
+config_specs = ("resolution", "dl_captions", "dl_audio", "dl_video", "dl_thumbnail") # Options that get saved to the config per link
+
 def get_files(entry: dict) -> dict:
     '''
     Gets the value for the 'files' key from the given dictionary
@@ -36,6 +42,13 @@ def get_files(entry: dict) -> dict:
     else:
         return None
 
+@lru_cache(maxsize=1)
+def _has_ffmpeg() -> bool:
+    '''
+    Returns whether ffmpeg is installed, only searches the PATH the first time
+    '''
+    return shutil.which("ffmpeg") is not None
+
 # logging.basicConfig(level=logging.DEBUG)
 
 class YouMirror:
@@ -51,8 +64,8 @@ class YouMirror:
         self.path: Path = Path(self.root)                                # Wrap root in a path object for convenience
         self.db_file: str = databaser.db_file                       # Default name for the database file
         self.config_file: str = configurer.config_file              # Default name for the config file
-        self.db_path: Path = self.path/Path(self.db_file)           # Full path for db file
-        self.config_path: Path = self.path/Path(self.config_file)   # Full path for config file
+        self.db_path: Path = self.path/self.db_file                 # Full path for db file (built once, used everywhere)
+        self.config_path: Path = self.path/self.config_file         # Full path for config file
         self.config: dict = dict()                                    # configs from file
         self.cache: dict[str: Union[Playlist, Channel, YouTube]] = dict() # This is used so we don't have to reinitialize pytube objects we've already made, because initializing them is slow
             
@@ -65,7 +78,7 @@ class YouMirror:
         path = self.path
         config_path = self.config_path
         db_path = self.db_path
-        if self.root in ["", "."]:         # If they don't pass a root, just name it the current directory
+        if self.root in ("", "."):         # If they don't pass a root, just name it the current directory
             absolute = Path('.').absolute()
             self.root = Path(absolute).name
         
@@ -82,7 +95,7 @@ class YouMirror:
             print(f"Config file \'{config_path}\' already exists")
         if not db_path.is_file():
             print(f"Creating database \'{db_path}\'")
-            filer.create_file(db_path)
+            databaser.new_database(db_path)
         else:
             print(f"Database \'{db_path}\' already exists")
 
@@ -100,132 +113,121 @@ class YouMirror:
         if not (active_options := self.load_options(**kwargs)):
             print("Could not load options")
             return
-        logging.debug("Active options:", active_options)
+        logging.debug("Active options: %r", active_options)
 
         # Parse the url & create pytube object
         try:
             if not (yt_string := tuber.link_type(url)):             # Get the url type (channel, playlist, single)
                 print(f"Invalid url \'{url}\'")
                 return False
-            if not (id := tuber.link_id(url)):                      # Get the id from the url
+            if not tuber.link_id(url, yt_string):                   # Make sure we can get the id from the url
                 print(f'Could not parse id from url \'{url}\'')
                 return False
-            if not (yt := self.get_pytube(url, self.cache)):        # Get the proper pytube object                    
+            if not (yt := self.get_pytube(url, yt_string)): # Get the proper pytube object                    
                 print(f'Could not parse url \'{url}\'')
                 return False
-            if not (url := tuber.get_url(yt)):                      # Sanitize the url
+            _, name, url = tuber.get_specs(yt)                      # Get the name and sanitized url in one go
+            if not url:
                 return   
             if configurer.yt_exists(yt_string, url, self.config):   # Check if the link is already in the mirror
                 print(f'url \'{url}\' already exists in the mirror')
                 return False
         except Exception as e:
-            logging.exception(f"Could not parse url {url} due to {e}")
+            logging.exception("Could not parse url %s due to %s", url, e)
             return False
-
-        # Collect the specs
-        try:
-            name = tuber.get_name(yt)  # Get the name of the pytube object                
-            last_updated = datetime.now().strftime('%Y-%m-%d')  # Mark today's date as the last updated
-        except Exception as e:
-            logging.exception(f"Failed to collect specs from url error: {e}")
+        last_updated = datetime.now().strftime('%Y-%m-%d')          # Mark today's date as the last updated
 
         # These will be saved to the config for this link
         specs = {"name": name, "last_updated": last_updated}
-        for spec in ['resolution', 'dl_captions', 'dl_audio', 'dl_video', 'dl_thumbnail']:
+        for spec in config_specs:
             if kwargs.get(spec, None) is not None:  # If it's specified, record in config
                 specs.update({spec: kwargs.get(spec)})
 
         # Add the info to the config
         yt_string = tuber.yt_to_type_string(yt)    # Get the yt type string
         print(f"Adding \'{name}\' to the mirror")
-        logging.info(f"Adding {url} to the mirror")
+        logging.info("Adding %s to the mirror", url)
         self.config = configurer.set_yt(yt_string, url, self.config, specs)
 
-        paths_table = databaser.open_table(self.db_path, "paths") # Need this to resolve collisions (only checking paths)
-
         # Local dicts before committing to db
         url_to_add = dict()                     # Wildcard url, could be channel, playlist or single 
         singles_to_add = dict()                 # Singles
         paths_to_add = dict()                   # Paths
         files_to_add = dict()                   # Files
 
-        # Generate keys for the db
-        keys = self.generate_keys(yt, dict(), active_options, paths_table)    # Get all the keys to add to the table
-        url_to_add[url] = keys                                      # Mark the url for adding
-        paths_to_add.update({ keys["path"]: {"parent": url} })      # Mark the path for adding
-        logging.info(f"Adding {url} with keys {keys}")
+        # Open everything we need in one go, it all gets committed together at the end
+        with databaser.open_tables(self.db_path, "paths", "single", "files", yt_string) as tables:
+            paths_table = tables["paths"]       # Need this to resolve collisions (only checking paths)
+            taken_paths = ChainMap(paths_to_add, paths_table)   # Paths in the db plus the ones we're adding, without copying either
 
-        if "files" in keys:
-            files = deepcopy(keys["files"])                         # Make a copy of the files
-            files = self.init_files(files, url, active_options)     # Put some initial values
-            files_to_add.update(files)                              # Mark the files for adding
-            logging.info(f"Adding files {files}")
+            # Generate keys for the db
+            keys = self.generate_keys(yt, dict(), active_options, taken_paths)    # Get all the keys to add to the table
+            url_to_add[url] = keys                                      # Mark the url for adding
+            paths_to_add.update({ keys["path"]: {"parent": url} })      # Mark the path for adding
+            logging.info("Adding %s with keys %s", url, keys)
 
-        # Handle children
-        children = tuber.get_children(yt)
-        if children:   # If the passed url has any children
+            if "files" in keys:
+                files = self.init_files(keys["files"], url, active_options)     # Copy the files with some initial values
+                files_to_add.update(files)                              # Mark the files for adding
+                logging.info("Adding files %s", files)
 
-            print(f'Found {len(children)} Youtube videos')
-            parent_keys = {"parent": url, "parent_name": keys["name"], 
-            "parent_type": yt_string, "path": keys["path"]}       # passing in parent info
+            # Handle children
+            children = tuber.get_children(yt)
+            if children:   # If the passed url has any children
 
-            for child_url in children:
+                print(f'Found {len(children)} Youtube videos')
+                parent_keys = {"parent": url, "parent_name": keys["name"], 
+                "parent_type": yt_string, "path": keys["path"]}       # passing in parent info
 
-                yt = self.get_pytube(child_url, self.cache)                 # Get the pytube object
-                child_keys = self.generate_keys(yt, parent_keys, active_options, paths_table) # Get the keys for the db
-                name = child_keys['name']                                   # Get the name of the pytube object
-                print(f'Adding \'{name}\'')
-                singles_to_add[child_url] = child_keys                            # Mark it for adding
-                # logging.info(f"Adding {child_url} with keys {child_keys}")
+                fetched = self.fetch_children(children)                         # Collect the children's data concurrently
 
-                files = deepcopy(child_keys["files"])                       # Make a copy of the files
-                files = self.init_files(files, child_url, active_options)   # Put some initial values
-                files_to_add.update(files)                                  # Mark the files for adding
-                # logging.info(f"Adding files {files}")
+                for child_url in children:
 
-                new_path = deepcopy(child_keys["path"])                     # Make a copy of the path
-                paths_to_add.update({ new_path: {"parent": child_url} })    # Mark it for adding
-                # logging.info(f"Adding path {new_path}")
+                    yt, metadata = fetched[child_url]                           # Get the pytube object and its metadata
+                    if metadata is None:                                        # Skip anything we couldn't reach
+                        print(f'Could not get info for \'{child_url}\'')
+                        continue
+                    child_keys = self.generate_keys(yt, parent_keys, active_options, taken_paths, metadata) # Get the keys for the db
+                    name = child_keys['name']                                   # Get the name of the pytube object
+                    print(f'Adding \'{name}\'')
+                    singles_to_add[child_url] = child_keys                            # Mark it for adding
 
-        # Calculate download size
-        if not kwargs.get("no_dl", False):
-            download_size = self.calculate_download_size(files_to_add, active_options)
+                    files = self.init_files(child_keys["files"], child_url, active_options)   # Copy the files with some initial values
+                    files_to_add.update(files)                                  # Mark the files for adding
 
-            # Show download size
-            download_size = printer.human_readable(download_size)   # Convert to human readable
-            print(f'Downloading will add {download_size} to the mirror')
+                    new_path = child_keys["path"]                               # Get the path
+                    paths_to_add.update({ new_path: {"parent": child_url} })    # Mark it for adding
 
-        # Ask for confirmation
-        if not kwargs.get("force", False) and not kwargs.get("no_dl", False):
-            if input("Continue? (y/n) ") != "y":                    # Get confirmation
-                print("Aborting")
-                return
+            # Calculate download size
+            if not kwargs.get("no_dl", False):
+                download_size = self.calculate_download_size(files_to_add, active_options)
 
-        print("Saving...")
+                # Show download size
+                download_size = printer.human_readable(download_size)   # Convert to human readable
+                print(f'Downloading will add {download_size} to the mirror')
 
-        # Update config file
-        configurer.save_config(self.config_path, self.config)
-
-        # Save changes to database
-        if yt_string in ['channel', 'playlist']:    # If it's a channel or playlist
-            table = databaser.open_table(self.db_path, yt_string) # Get the appropriate database
-            table[url] = keys                       # Add it to the database
-            databaser.commit_table(table)           # Commit and close
-            databaser.close_table(table)
-        else:
-            singles_to_add[url] = keys  # Else, add it to the singles pile
-        singles_table = databaser.open_table(self.db_path, "single")  # Where yt videos go
-        files_table = databaser.open_table(self.db_path, "files")  # Where files go
-        
-        # Add local changes
-        files_table.update(files_to_add)       # Record the files in the database
-        paths_table.update(paths_to_add)       # Record the paths in the database
-        singles_table.update(singles_to_add)   # Record the singles in the database
+            # Ask for confirmation
+            if not kwargs.get("force", False) and not kwargs.get("no_dl", False):
+                if input("Continue? (y/n) ") != "y":                    # Get confirmation
+                    print("Aborting")
+                    return
 
-        # Commit changes and close
-        for table in [files_table, paths_table, singles_table]:
-            databaser.commit_table(table)
-            databaser.close_table(table)
+            print("Saving...")
+
+            # Update config file
+            configurer.save_config(self.config_path, self.config)
+
+            # Save changes to database
+            if yt_string in parent_strings:    # If it's a channel or playlist
+                tables[yt_string][url] = keys           # Add it to the database
+            else:
+                singles_to_add[url] = keys  # Else, add it to the singles pile
+
+            # Add local changes
+            logging.info("Adding %s singles, %s paths and %s files", len(singles_to_add), len(paths_to_add), len(files_to_add))
+            databaser.set_entries(files_to_add, tables["files"])        # Record the files in the database
+            databaser.set_entries(paths_to_add, paths_table)            # Record the paths in the database
+            databaser.set_entries(singles_to_add, tables["single"])     # Record the singles in the database
 
         # Check if downloading is skipped
         if kwargs.get("no_dl", False):
@@ -234,7 +236,7 @@ class YouMirror:
         
         # Sync all the files for this url
         if not kwargs.get("no_dl", False):
-            self.sync(url=url, kwargs=kwargs)   
+            self.sync(url=url, **kwargs)
 
         print("Done!")
 
@@ -254,13 +256,12 @@ class YouMirror:
         try:
             if not (yt_string := tuber.link_type(url)):                # Get the url type (channel, playlist, single)
                 return False
-            if not (id := tuber.link_id(url)):                         # Get the id from the link
+            if not tuber.link_id(url, yt_string):                      # Make sure we can get the id from the link
                 return False
-            if not (yt := self.get_pytube(url, self.cache)):           # Get the proper pytube object
+            if not (yt := self.get_pytube(url, yt_string)): # Get the proper pytube object
                 return False
-            if not (url := tuber.get_url(yt)):                         # Need to get url from pytube in case user passed a dirty one
-                return False
-            if not (name := tuber.get_name(yt)):
+            _, name, url = tuber.get_specs(yt)                         # Need to get url from pytube in case user passed a dirty one
+            if not (url and name):
                 return False
         except Exception as e:
             logging.exception('Could not get info for url \'%s\' due to %s', url, e)
@@ -273,16 +274,15 @@ class YouMirror:
             return
 
         # Get info from the db
-        table = databaser.open_table(self.db_path, yt_string, autocommit=False)     # Open database
-        entry = databaser.get_entry(url, table) # Get the keys for the db entry
-        databaser.close_table(table)            # Close for now
+        with databaser.open_tables(db_path, yt_string) as tables:
+            entry = databaser.get_entry(url, tables[yt_string]) # Get the keys for the db entry
         remove_path = entry["path"]             # Get the path
-        remove_path = str(self.path/Path(remove_path))  # Add the root to the path
+        root_path = os.path.join(self.path, remove_path)  # Add the root to the path (the db keys don't have it)
 
         # Calculate the size of the directory
         if not kwargs.get("no_rm", False):
             print("Calculating removal size...")
-            path_size = self.calculate_path_size(remove_path)
+            path_size = self.calculate_path_size(root_path)
             print(f"Removing will delete {printer.human_readable(path_size)} from the mirror")
 
         # Ask for confirmation
@@ -294,51 +294,47 @@ class YouMirror:
         # Remove the directory
         if not kwargs.get("no_rm" ,False):
             print("Deleting files...")
-            shutil.rmtree(remove_path, ignore_errors=True)
+            shutil.rmtree(root_path, ignore_errors=True)
+            filer.clear_dir_cache()                     # Some of those directories are gone now
   
         # Calculate changes
         paths_to_remove = set() # Track stuff to remove
         files_to_remove = set()
         singles_to_remove = set()
-        singles_table = databaser.open_table(db_path, "single", autocommit=True)   # Open singles table
 
         paths_to_remove.add(remove_path)                # Mark the path for removal
         if files := get_files(entry):                   # Mark any files for removal
             files_to_remove.add(files)
 
-        if yt_string in ["channel", "playlist"]:        # If it's a channel or playlist
+        if yt_string in parent_strings:        # If it's a channel or playlist
             singles_to_remove.update(entry["children"]) # Mark the children for removal
         else:
             singles_to_remove.add(url)                  # Else, mark it for removal
 
-        for single in singles_to_remove:
-            entry = databaser.get_entry(single, singles_table)
-            path = entry["path"]
-            paths_to_remove.add(path)
-            files = entry["files"]
-            files_to_remove.update(files)
+        # Open databases, everything is committed together at the end
+        with databaser.open_tables(db_path, "single", "files", "paths", "vid_info", yt_string) as tables:
+            singles_table = tables["single"]
+            for single in singles_to_remove:
+                entry = databaser.get_entry(single, singles_table)
+                path = entry["path"]
+                paths_to_remove.add(path)
+                files = entry["files"]
+                files_to_remove.update(files)
 
-        print(f'removing {len(singles_to_remove)} singles')
-        print(f'removing {len(paths_to_remove)} paths')
-        print(f'removing {len(files_to_remove)} files')
+            print(f'removing {len(singles_to_remove)} singles')
+            print(f'removing {len(paths_to_remove)} paths')
+            print(f'removing {len(files_to_remove)} files')
 
-        print("Saving changes...", end='')
-        # Open databases
-        db_path = self.db_path
-        files_table = databaser.open_table(db_path, "files", autocommit=True) # Get the files table
-        paths_table = databaser.open_table(db_path, "paths", autocommit=True) # Get the paths table
+            print("Saving changes...", end='')
 
-        # Make changes to the database
-        if yt_string != 'single':   # If it's a channel or playlist, make sure to remove from its table
-            table = databaser.open_table(db_path, yt_string, autocommit=True)
-            databaser.remove_entry(url, table)
+            # Make changes to the database
+            if yt_string != 'single':   # If it's a channel or playlist, make sure to remove from its table
+                databaser.remove_entry(url, tables[yt_string])
 
-        for path in paths_to_remove:                    # Remove paths
-            databaser.remove_entry(path, paths_table)
-        for file in files_to_remove:                    # Remove files
-            databaser.remove_entry(file, files_table)
-        for single in singles_to_remove:                # Remove singles
-            databaser.remove_entry(single, singles_table)
+            databaser.remove_entries(paths_to_remove, tables["paths"])      # Remove paths
+            databaser.remove_entries(files_to_remove, tables["files"])      # Remove files
+            databaser.remove_entries(singles_to_remove, singles_table)      # Remove singles
+            databaser.remove_entries(singles_to_remove, tables["vid_info"]) # And anything we saved from youtube for them
 
         # Update config file
         self.config = configurer.remove_yt(yt_string, url, self.config)  # Remove from the config file
@@ -349,6 +345,7 @@ class YouMirror:
     def sync(self, url: str = None, **kwargs: dict) -> None:
         '''
         Syncs the mirror against the database
+        If no url is given everything gets synced, all the downloads share one pool
         '''
 
         # Localize our paths so we don't have to type self a bunch of times
@@ -362,87 +359,134 @@ class YouMirror:
         # Load the active options
         active_options = self.load_options(**kwargs)
 
-        # Open databases
-        files_table = databaser.open_table(db_path, "files") # Get the files table
-        singles_table = databaser.open_table(db_path, "single") # Get the singles table 
-
         if url:         # If a url is specified, just sync that
+            urls_to_sync = [url]
+        else:           # If no url is specified, sync everything
+            urls_to_sync = list()
+            for yt_string in yt_strings:    # Collecting urls from config
+                urls_to_sync.extend(configurer.get_urls(yt_string, self.config))
 
-            # Get some url info and verify it
-            if not (yt_string := tuber.link_type(url)):            # Get the type of link
-                return False
-            if not (yt := self.get_pytube(url, self.cache)):       # Get the yt object
-                return False
-            if not (url := tuber.get_url(yt)):                     # Sanitize the url
-                return False
-            if not configurer.yt_exists(yt_string, url, self.config):# Verify url is in the mirror
-                logging.error("Could not find url %s in the mirror", url)
-                return False
-            if kwargs.get("update"):                    # Update if specified
-                self.update(url=url, **kwargs)                      
-            name = tuber.get_name(yt)                   # Get name for pretty printing
-
-            print(f"Syncing with {yt_string} \'{name}\'")
-
-            files_to_sync = dict()  
-
-            # Gather files for downloading
-            if yt_string in ['channel', 'playlist']:               # Handling a channel or playlist 
-                table = databaser.open_table(db_path, yt_string)   # Open a table
-                entry = databaser.get_entry(url, table)            # Get the entry
-                children = entry['children']                  # Get the children from the db
-                for child_url in children:
-                    files = singles_table[child_url]["files"] # Get the children files
-                    for filepath in files:                  # Get the files from the files table
-                        info = files_table[filepath]        # File dictionary
-                        if not info["downloaded"]:          # If not downloaded
-                            files_to_sync[filepath] = info  # Mark for syncing
-
-            elif yt_string == 'single':                     # Handling a single
-                    files = singles_table[url]["files"]     # Get the files from the db
-                    for filepath in files:                  # Get the files from the files table
-                        info = files_table[filepath]        # File dictionary
-                        if not info["downloaded"]:          # If not downloaded
-                            files_to_sync[filepath] = info  # Mark for syncing
-
-            # Update options for this url
-            active_options.update(configurer.get_yt(yt_string, url, self.config))
+        # Open databases
+        with databaser.open_tables(db_path, "files", "paths", "vid_info", *parent_strings) as tables:
+            files_table = tables["files"]       # Get the files table
+            info_table = tables["vid_info"]     # Player responses we saved from the last sync
+
+            # Gather the downloads for every url first
+            files_to_sync = dict()
+            jobs = list()
+            names = list()
+            for sync_url in urls_to_sync:
+                if not (gathered := self._gather_sync(sync_url, tables, active_options, **kwargs)):
+                    if url:                     # The only url we were asked about is bad
+                        return False
+                    continue
+                name, files, url_jobs = gathered
+                names.append(name)
+                files_to_sync.update(files)
+                jobs.extend(url_jobs)
+
+            # Throw out saved player responses that ran out, most belong to videos that are done and would never be read again
+            databaser.remove_expired(time.time() + tuber.vid_info_margin, info_table)
+
+            # Offer the player responses we saved last time, if they're still good it saves asking youtube for each video
+            parents = {files_to_sync[filepath]["parent"] for filepath in files_to_sync}
+            for parent in parents:
+                tuber.offer_vid_info(self.get_pytube(parent, "single"), info_table.get(parent))
+            infos_to_add = dict()
+            infos_to_remove = set()
+            sizes = dict()                      # How much each path grew {path: bytes}, saved all at once
 
             # Download the files
             print(f'Syncing {len(files_to_sync)} files')
-            for filepath in files_to_sync:
-                file = files_to_sync[filepath]              # Get the file info
-                filename = str(Path(filepath).name)         # Get just the filename for pretty printing
-                parent = file["parent"]                     # Get the parent url
-                file_type = file["type"]                    # Get the file type "video", "audio", etc. 
-                yt = self.get_pytube(parent, self.cache)    # Get the pytube object   
-                print(f"Downloading {file_type} {filepath}")
-                if file["type"] == 'caption':               # If it's a caption record the language to use
-                    active_options['language'] = file['language']
-                filepath = str(self.path/Path(filepath))    # Add the root to the filepath
-                if (specs := downloader.download_single(yt, file_type, filepath, active_options)):
-                    file.update(specs)                      # Update the file info with the specs
-                    files_table.update({filepath: file})    # Save the file info to the database
-                    files_table.commit()                    # Commit the changes to the database
-                else:
-                    print(f'Could not download {file_type} {filename}')
-                
+            with databaser.FileWriteBatch(files_table) as batch:    # Saves files in batches, an interrupted sync still keeps its progress
+                for filepath, specs in downloader.download_many(jobs, active_options["jobs"]):
+                    file = files_to_sync[filepath]              # Get the file info
+                    parent = file["parent"]
+                    yt = self.get_pytube(parent, "single")
+                    if specs:
+                        file.update(specs)                      # Update the file info with the specs
+                        batch[filepath] = file                  # Save the file info to the database
+                        for path in filer.parent_paths(filepath):   # Every folder it's in got bigger
+                            sizes[path] = sizes.get(path, 0) + file.get("filesize", 0)
+                        if parent not in infos_to_add:          # Save what pytube fetched for next time
+                            if packed := tuber.pack_vid_info(yt):
+                                infos_to_add[parent] = packed
+                    else:
+                        filename = os.path.basename(filepath)   # Get just the filename for pretty printing
+                        print(f'Could not download {file["type"]} {filename}')
+                        if tuber.used_saved_vid_info(yt):       # The saved one might be bad, ask youtube next time
+                            infos_to_remove.add(parent)
+            filer.clear_dir_cache()                     # We just put new files on disk
+            databaser.add_path_sizes(sizes, tables["paths"])
+            databaser.set_entries(infos_to_add, info_table)
+            databaser.remove_entries(infos_to_remove, info_table)
+
+        for name in names:
             print(f"Synced with \'{name}\'!")
-            return
+        if not url:
+            print("All done!")
+        return
 
-        # If no url is specified, sync everything
-        urls_to_sync = list()
+    def _gather_sync(self, url: str, tables: dict, active_options: dict, **kwargs) -> tuple:
+        '''
+        Finds the files for the url that still need downloading
+        Returns (name, files_to_sync, jobs) or None if the url can't be synced
+        '''
+        # Get some url info and verify it
+        if not (yt_string := tuber.link_type(url)):            # Get the type of link
+            return None
+        if not (yt := self.get_pytube(url, yt_string)):   # Get the yt object
+            return None
+        if not (url := tuber.get_url(yt)):                     # Sanitize the url
+            return None
+        if not configurer.yt_exists(yt_string, url, self.config):# Verify url is in the mirror
+            logging.error("Could not find url %s in the mirror", url)
+            return None
+        if kwargs.get("update"):                    # Update if specified
+            self.update(url=url, **kwargs)                      
+        name = tuber.get_name(yt)                   # Get name for pretty printing
 
-        # Collecting urls from config
-        for yt_string in ["channel", "playlist", "single"]:
-            urls_to_sync.extend(configurer.get_urls(yt_string, self.config))
+        print(f"Syncing with {yt_string} \'{name}\'")
 
-        # Syncing every url
-        for url in urls_to_sync:
-            self.sync(url=url, **kwargs)
+        files_to_sync = dict()  
+        files_table = tables["files"]
 
-        print("All done!")
-        return
+        # Gather files for downloading
+        if yt_string in parent_strings:               # Handling a channel or playlist 
+            entry = databaser.get_entry(url, tables[yt_string]) # Get the entry
+            children = entry['children']                  # Get the children from the db
+            for child_url in children:
+                files = files_table.by_parent(child_url)    # Get the child's files straight from the files table
+                for filepath, info in files.items():
+                    if not info["downloaded"]:          # If not downloaded
+                        files_to_sync[filepath] = info  # Mark for syncing
+
+        elif yt_string == 'single':                     # Handling a single
+            files = files_table.by_parent(url)      # Get the files from the files table
+            for filepath, info in files.items():
+                if not info["downloaded"]:          # If not downloaded
+                    files_to_sync[filepath] = info  # Mark for syncing
+
+        # Options for this url
+        url_options = {**active_options, **configurer.get_yt(yt_string, url, self.config)}
+
+        # Gather the downloads
+        jobs = list()
+        folders = dict()                                # Each video's folder with the root added, shared by all of its files
+        for filepath in files_to_sync:
+            file = files_to_sync[filepath]              # Get the file info
+            parent = file["parent"]                     # Get the parent url
+            file_type = file["type"]                    # Get the file type "video", "audio", etc. 
+            yt = self.get_pytube(parent, "single")  # Files always belong to a single
+            options = url_options
+            if file_type == 'caption':                  # If it's a caption record the language to use
+                options = {**url_options, 'language': file['language']}
+            print(f"Downloading {file_type} {filepath}")
+            folder, filename = os.path.split(filepath)
+            if (path := folders.get(folder)) is None:
+                path = folders[folder] = os.path.join(self.path, folder)     # Add the root to the folder
+            jobs.append((filepath, yt, file_type, os.path.join(path, filename), options, path))
+        return name, files_to_sync, jobs
 
 
     def update(
@@ -466,76 +510,80 @@ class YouMirror:
         if url:
 
             # Get some url info and verify it
-            if not tuber.link_type(url):            # Verify the url
+            if not (yt_string := tuber.link_type(url)):        # Verify the url and get the type of link
                 return False
-            if not (yt := self.get_pytube(url, self.cache)):   # Get the pytube object
+            if yt_string == 'single':               # Singles dont get updated
                 return False
-            if tuber.link_type(url) == 'single':    # Singles dont get updated
+            if not (yt := self.get_pytube(url, yt_string)):   # Get the pytube object
                 return False
             if not (new_children := set(tuber.get_children(yt))):  # Get the children urls
                 return False
-            if not (yt_string := tuber.link_type(url)):        # Get the type of link
-                return False
             name = tuber.get_name(yt)               # Get the name for pretty printing
             url = tuber.get_url(yt)                 # Sanitize the url
             active_options.update(configurer.get_yt(yt_string, url, self.config))   # Load the settings for this yt
 
-            # Calculate new children
-            table = databaser.open_table(db_path, yt_string)    # Open the appropriate table
-            entry = databaser.get_entry(url, table)             # Get the entry from the table
-            old_children = set(entry["children"])                    # Get the children from the entry
-            difference = new_children.difference(old_children)       # Get the difference between the two sets
-            print(f'Found {len(difference)} new items for {yt_string} {name}')
-            entry["children"] = new_children.union(old_children)     # Update the entry with the new children
-
-            # Record parent's info
-            parent_keys = {"parent": url, "parent_name": entry["name"], 
-            "parent_type": yt_string, "path": entry["path"]}       # passing in parent info
-
-            # Local dicts to track before committing
-            singles_to_add = dict()
-            files_to_add = dict()
-            paths_to_add = dict()
-            paths_table = databaser.open_table(db_path, "paths")   # Open the paths table (to resolve collisions)
-
-            # Calculate info for the new singles
-            for child_url in difference:
-                yt = self.get_pytube(child_url, self.cache)                 # Get the pytube object
-                child_keys = self.generate_keys(yt, parent_keys, active_options, paths_table) # Get the keys for the db
-                name = child_keys['name']                                   # Get the name of the pytube object
-                print(f'Adding \'{name}\'')
-                singles_to_add[child_url] = child_keys                      # Mark it for adding
-
-                files = deepcopy(child_keys["files"])                       # Make a copy of the files
-                files = self.init_files(files, child_url, active_options)   # Put some initial values
-                files_to_add.update(files)                                  # Mark the files for adding
-
-                new_path = child_keys["path"]                               # Make a copy of the path
-                paths_to_add.update({ new_path: {"parent": child_url} })    # Mark it for adding
-
-            # Open tables
-            singles_table = databaser.open_table(self.db_path, "single")  # Where yt videos go
-            files_table = databaser.open_table(self.db_path, "files")  # Where files go
-        
-            # Add local changes
-            databaser.set_entry(url, entry, table) # Add the new children
-            files_table.update(files_to_add)       # Record the files in the database
-            paths_table.update(paths_to_add)       # Record the paths in the database
-            singles_table.update(singles_to_add)   # Record the singles in the database
-
-            # Commit changes and close
-            for t in [table, files_table, paths_table, singles_table]:
-                databaser.commit_table(t)
-                databaser.close_table(t)
+            # Open everything we need in one go, it all gets committed together at the end
+            with databaser.open_tables(db_path, yt_string, "paths", "single", "files") as tables:
+                table = tables[yt_string]                       # The appropriate table
+                paths_table = tables["paths"]                   # The paths table (to resolve collisions)
+
+                # Calculate new children
+                entry = databaser.get_entry(url, table)             # Get the entry from the table
+                old_children = set(entry["children"])                    # Get the children from the entry
+                difference = new_children.difference(old_children)       # Get the difference between the two sets
+                print(f'Found {len(difference)} new items for {yt_string} {name}')
+                entry["children"] = new_children.union(old_children)     # Update the entry with the new children
+
+                # Record parent's info
+                parent_keys = {"parent": url, "parent_name": entry["name"], 
+                "parent_type": yt_string, "path": entry["path"]}       # passing in parent info
+
+                # Local dicts to track before committing
+                singles_to_add = dict()
+                files_to_add = dict()
+                paths_to_add = dict()
+                taken_paths = ChainMap(paths_to_add, paths_table)   # Paths in the db plus the ones we're adding, without copying either
+
+                # Calculate info for the new singles
+                fetched = self.fetch_children(list(difference))                 # Collect the new children's data concurrently
+                for child_url in difference:
+                    yt, metadata = fetched[child_url]                           # Get the pytube object and its metadata
+                    if metadata is None:                                        # Skip anything we couldn't reach
+                        print(f'Could not get info for \'{child_url}\'')
+                        continue
+                    child_keys = self.generate_keys(yt, parent_keys, active_options, taken_paths, metadata) # Get the keys for the db
+                    name = child_keys['name']                                   # Get the name of the pytube object
+                    print(f'Adding \'{name}\'')
+                    singles_to_add[child_url] = child_keys                      # Mark it for adding
+
+                    files = self.init_files(child_keys["files"], child_url, active_options)   # Copy the files with some initial values
+                    files_to_add.update(files)                                  # Mark the files for adding
+
+                    new_path = child_keys["path"]                               # Get the path
+                    paths_to_add.update({ new_path: {"parent": child_url} })    # Mark it for adding
+
+                # Add local changes
+                logging.info("Adding %s singles, %s paths and %s files", len(singles_to_add), len(paths_to_add), len(files_to_add))
+                databaser.set_entry(url, entry, table)                      # Add the new children
+                databaser.set_entries(files_to_add, tables["files"])        # Record the files in the database
+                databaser.set_entries(paths_to_add, paths_table)            # Record the paths in the database
+                databaser.set_entries(singles_to_add, tables["single"])     # Record the singles in the database
 
             print(f"Updated \'{name}\'!")
             return
 
         # If no url is specified, update everything
         urls_to_update: list = []
-        for yt_string in ['channel', 'playlist']:
-            urls_to_update.extend(configurer.get_urls(yt_string, self.config))
-            
+        yts = list()
+        for yt_string in parent_strings:
+            urls = configurer.get_urls(yt_string, self.config)
+            urls_to_update.extend(urls)
+            yts.extend(self.get_pytube(url, yt_string) for url in urls)
+
+        # Page through every channel and playlist at once, update() then finds the children already fetched
+        print(f"Checking {len(urls_to_update)} channels and playlists for new items")
+        tuber.get_children_batch([yt for yt in yts if yt is not None], max_fetches)
+
         # Update all the urls
         for url in urls_to_update:
             self.update(url=url, **kwargs)
@@ -561,37 +609,13 @@ class YouMirror:
         --- This is obviously pretty barebones, a lot could go into formatting this and offering different options
         '''
 
-        # Localize our paths so we don't have to type self a bunch of times
-        config_path = self.config_path
-
         if not self.verify_config():
             return
-        self.config = configurer.load_config(config_path)       # Load the config file
-
-        # Print the config
-        channels = configurer.get_section('channel', self.config)
-        playlists = configurer.get_section('playlist', self.config)
-        singles = configurer.get_section('single', self.config)
-        print('TYPE --- NAME --- URL')
-        print('-'* 30)
-
-        for yt in channels:
-            item = channels[yt]
-            name = item['name']
-            url = yt
-            print(f"channel - {name} - {url}")
-
-        for yt in playlists:
-            item = playlists[yt]
-            name = item['name']
-            url = yt
-            print(f"playlist - {name} - {url}")
-
-        for yt in singles:
-            item = singles[yt]
-            name = item['name']
-            url = yt
-            print(f"single - {name} - {url}")
+
+        # Everything is in the database, so there's no need to parse the config
+        rows = ['TYPE --- NAME --- URL', '-'* 30]
+        rows.extend(f"{yt_string} - {name} - {url}" for yt_string, name, url in databaser.list_all(self.db_path))
+        print('\n'.join(rows))     # Print all the rows in one go
 
     def archive(self, root: str) -> None:
         '''
@@ -613,33 +637,51 @@ class YouMirror:
         '''
         return
 
-    def get_pytube(self, url: str, cache: dict) -> None:
+    def get_pytube(self, url: str, url_type: str = None) -> Union[YouTube, Channel, Playlist]:
         '''
-        Returns a new pytube object or one from the cache
+        Returns a new pytube object or one from self.cache
         '''
         try:
-            if url in cache:                    # If the url is already cached, return its object
-                return cache[url]
-            else:
-                pytube = tuber.new_pytube(url)  # Get new pytube object
-                cache[url] = pytube             # Cache it
-                return pytube
+            if (pytube := self.cache.get(url)) is None:     # One lookup, and urls that failed get another try
+                pytube = tuber.new_pytube(url, url_type)    # Get new pytube object
+                if pytube is not None:
+                    self.cache[url] = pytube                # Cache it
+            return pytube
         except Exception as e:
-            logging.exception('Could not get pytube object for %s due to', url, e)
+            logging.exception('Could not get pytube object for %s due to %s', url, e)
             return None
 
-    def generate_keys(self, yt: Union[Channel, Playlist, YouTube], keys: dict, options: dict, paths: dict) -> dict:
+    def fetch_children(self, children: list[str]) -> dict:
+        '''
+        Gets the pytube objects and metadata for all the children at once
+        Returns {url: (yt, metadata)}, metadata is None if the child could not be reached
+        Children whose availability couldn't be checked get checked once more
+        '''
+        yts = [self.get_pytube(url, "single") for url in children]  # Children are always videos, no need to check the url
+        metadatas = tuber.get_metadata_batch(yts, max_fetches)      # The part that waits on youtube
+        unknown = [i for i, metadata in enumerate(metadatas) if metadata and metadata["available"] is None]
+        if unknown:                                                 # The availability check failed on the connection, give those one more try
+            logging.info("Checking availability again for %s videos", len(unknown))
+            retried = tuber.get_metadata_batch([yts[i] for i in unknown], max_fetches)
+            for i, metadata in zip(unknown, retried):
+                if metadata is not None:                            # Keep what we had if the retry fell over completely
+                    metadatas[i] = metadata
+        return {url: (yt, metadata) for url, yt, metadata in zip(children, yts, metadatas)}
+
+    def generate_keys(self, yt: Union[Channel, Playlist, YouTube], keys: dict, options: dict, paths: dict, metadata: dict = None) -> dict:
         '''
         Generates the keys that we want to put into the database and returns as a dictionary.
         You can pass in a dict if you want to inject some values from above
+        Pass in the metadata if it was already collected so we don't ask youtube again
         '''
-        keys = deepcopy(keys)                     # Make a copy of the injected keys so they don't get altered
+        keys = dict(keys)                         # Copy the injected keys so they don't get altered (they're all strings)
         yt_string = tuber.yt_to_type_string(yt)   # Get the type as a string
-        metadata = tuber.get_metadata(yt)         # Strip the useful data off the pytube object
+        if metadata is None:
+            metadata = tuber.get_metadata(yt)     # Strip the useful data off the pytube object
         keys.update(metadata)                     # Add to our keys
-        yt_id = tuber.get_id(yt)                  # We use this to resolve collisions
+        yt_id = keys["id"]                        # We use this to resolve collisions (already in the metadata)
 
-        if yt_string in ["channel", "playlist"]:    # Do the same stuff for channels and playlists
+        if yt_string in parent_strings:    # Do the same stuff for channels and playlists
             path = filer.calculate_path(yt_string, keys["name"], "")
             keys["path"] = filer.resolve_collision(path, paths, yt_id)
             return keys
@@ -657,42 +699,38 @@ class YouMirror:
                 temp = filer.calculate_path(yt_string, "", keys["name"])
                 keys["path"] = filer.resolve_collision(temp, paths, yt_id)
             else:   # Take the path and add the name
-                name = safe_filename(keys["name"]).replace(' ', '_')
-                temp = str(Path(keys["path"])/Path(name))
+                name = filer.safe_name(keys["name"])
+                temp = os.path.join(keys["path"], name)
                 keys["path"] = filer.resolve_collision(temp, paths, yt_id)
                 
             keys["files"] = filer.get_files(keys["path"], keys["name"], options)  # Get the files for this video
             return keys
         else: 
-            logging.error(f"Failed to get keys for {yt_string} {yt}")
+            logging.error("Failed to get keys for %s %s", yt_string, yt)
             return None
 
     def init_files(self, files: dict, url: str, options: dict) -> dict:
         '''
-        Takes files and fills in some default values
+        Returns a copy of the files with some default values filled in
+        The passed files are left alone, so there's no need to copy them first
         '''
-        for filepath in files:    # Add some extra info we only want in the files table
-            file = files[filepath]
-            file["parent"] = url
-            file["downloaded"] = False
-            logging.debug((f'Updating file {filepath} with keys {file}'))
-        return files
+        return {filepath: {**files[filepath], "parent": url, "downloaded": False} for filepath in files} # Extra info we only want in the files table
 
     def calculate_download_size(self, files: dict, options: dict) -> int:
         '''
         Calculates the total size of the files to be downloaded
         '''
-        download_size = 0
+        items = list()
         for filepath in files:
-            file = files[filepath]               # Get the file info
+            file = files[filepath]                      # Get the file info
             parent = file["parent"]                     # Get the parent url
-            yt = self.get_pytube(parent, self.cache)    # Get the pytube object
-            file_type = file["type"]                    # Get the file type "video", "audio", etc.    
-            print(f"Calculating filesize for {file_type} {str(Path(filepath).name)}")
-            filesize = downloader.calculate_filesize(yt, file_type, options)   # Get the filesize
-            file["filesize"] = filesize                 # Record the filesize while we're here
-            download_size += filesize                   # Add the filesize to the total download size
-        return download_size
+            yt = self.get_pytube(parent, "single")  # Files always belong to a single
+            items.append((yt, file["type"]))            # The file type "video", "audio", etc.
+        print(f"Calculating filesize for {len(items)} files")
+        filesizes = downloader.calculate_filesizes(items, options)  # Get all the filesizes at once
+        for filepath, filesize in zip(files, filesizes):
+            files[filepath]["filesize"] = filesize      # Record the filesize while we're here
+        return sum(filesizes)                           # Add up the total download size
 
     def calculate_path_size(self, path):
         '''
@@ -701,20 +739,18 @@ class YouMirror:
         path_size = 0
         for root, dirs, files in os.walk(path, topdown=False):  # Find all the files in the directory
             for name in files:                                  # Search through all the files
-                filepath = os.path.join(root, name)             # Get the filepath
-                filepath = Path(filepath)
-                path_size += filepath.stat().st_size
+                path_size += os.path.getsize(os.path.join(root, name))  # Add the file's size
         return path_size
 
     def verify_config(self) -> bool:
         '''
         Verifies all the files are available
         '''
-        if not self.config_path.is_file():               # Verify the config file exists   
-            logging.error(f'Could not find config file in directory \'{self.path}\'')
+        if not os.path.isfile(self.config_path):         # Verify the config file exists   
+            logging.error("Could not find config file in directory '%s'", self.path)
             return False
-        if not self.db_path.is_file():                   # Verify the database file exists
-            logging.error(f'Could not find database file in directory \'{self.path}\'')
+        if not os.path.isfile(self.db_path):             # Verify the database file exists
+            logging.error("Could not find database file in directory '%s'", self.path)
             return False
         return True
 
@@ -725,22 +761,19 @@ class YouMirror:
         try:
             self.config = configurer.load_config(self.config_path)
         except Exception as e:
-            logging.exception(f"Could not load given config file due to {e}")
+            logging.exception("Could not load given config file due to %s", e)
             return
 
     def load_options(self, **kwargs):
         '''
         Loads various options
         '''
-        active_options = configurer.defaults                                # Load default options
         global_options = configurer.get_globals(self.config)                # Get global options
-        active_options.update(global_options)                               # Overwrite with globals
-        for key in kwargs:
-            if kwargs.get(key) is not None:                                    # If the value is not None, update the config
-                active_options.update({key: kwargs.get(key)})
-        active_options["has_ffmpeg"] = shutil.which("ffmpeg") is not None   # Record whether they have ffmpeg
+        cli_options = {key: value for key, value in kwargs.items() if value is not None}   # Only options that were actually given
+        active_options = {**configurer.defaults, **global_options, **cli_options}           # Defaults < globals < kwargs, without touching the defaults
+        active_options["has_ffmpeg"] = _has_ffmpeg()                        # Record whether they have ffmpeg
         if active_options["resolution"] not in downloader.resolutions:
-            logging.error(f"Invalid resolution \'{active_options['resolution']}\', valid resolutions = {downloader.resolutions}")                                      # Validate resolution
+            logging.error("Invalid resolution '%s', valid resolutions = %s", active_options['resolution'], downloader.resolutions)                                      # Validate resolution
             return None
         return active_options
 
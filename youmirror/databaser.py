@@ -31,50 +31,344 @@ db
                             | -- type:          "video", "audio", "caption", "thumbnail"     
                             | -- caption_type:  "en", "a.en"            # TODO this should probably be language
                             | -- resolution:    "480p", "720p", "1080p" Just for videos
-| --- paths
-        | -- name:      path name "singles/single_name/", "channels/channel_name"
-        | -- parent     url of parent channel or playlist or single
+| --- paths:            real sqlite table like files
+        | -- path:      primary key, path name "singles/single_name/", "channels/channel_name"
+        | -- parent     url of parent channel or playlist or single (indexed)
         | -- size:      total size of files inside
-| --- files:            dictionary that tracks all the files we have
+| --- files:            real sqlite table (not sqlitedict) that tracks all the files we have
         | -- filepath:  primary key, Ex: "singles/single_name/single_name.mp4"
-        | -- parent:    url of parent single
+        | -- parent:    url of parent single (indexed)
         | -- type:      file type: "video", "audio", "caption", "thumbnail"
         | -- language:  "en, a.en, fr"
         | -- resolution:"1080p", "720p" etc
         | -- bitrate    Audio bitrate
+        | -- filesize:  file size
+        | -- length:    length of the video in seconds
+        | -- name:      caption name
+        | -- url:       caption or thumbnail url
         | -- downloaded: True/False
-        | -- size:      file size
+| --- vid_info:         pytube's player response for a single, so sync doesn't have to ask youtube again
+        | -- url:       primary key, url of the single
+        | -- expires:   when youtube's stream urls in it stop working (unix time, indexed)
+        | -- js_url:    the player js its signatures go with
+        | -- data:      the response as zlib compressed json
 
 I need to abstract the database management as much as possible so it's easy to swap out.
 If a better databasing system comes along I will use that instead, but for now sqlitedict is fine.
 '''
-from copy import deepcopy
-from sqlitedict import SqliteDict
+from contextlib import contextmanager, closing
+from sqlitedict import SqliteDict, decode
+import sqlite3
 import logging
+import atexit
+import os
 from pathlib import Path
 
 db_file = "youmirror.db"
-valid_tables = {"channel", "playlist", "single", "paths", "files"}
+valid_tables = frozenset({"channel", "playlist", "single", "paths", "files", "vid_info"})
+yt_tables = ("channel", "playlist", "single")   # Tables for youtube objects, in the order we list them
+journal_mode = "WAL"                            # Readers don't block the writer and each commit writes less
+pragmas = {"temp_store": "MEMORY", "cache_size": -64000, "mmap_size": 268435456}  # 64MB page cache, 256MB memory map (sqlitedict already turns synchronous off)
+batch_size = 64     # How many writes a FileWriteBatch holds before saving
+_tables = dict()    # Tables that are already open {(path, table_name, autocommit): (table, file_id)}
+file_columns = ("parent", "type", "language", "resolution", "bitrate", "filesize", "length", "name", "url", "downloaded")  # Everything we keep about a file besides its path
+path_columns = ("parent", "size")   # Everything we keep about a path
+vid_info_columns = ("expires", "js_url", "data")    # Everything we keep about a saved player response
+
+class ColumnTable:
+    '''
+    A table stored as real columns instead of pickled dicts, so a row can be read or changed
+    without unpickling anything and rows can be found by any indexed column
+    It acts like the sqlitedict tables (table[key] = {...}) so the rest of the code doesn't care
+    Only the keys in columns are kept, and keys that are None don't come back
+    Subclasses say what the table is called and what goes in it
+    '''
+    tablename = None
+    key_column = None           # The primary key, also what remove_entries deletes by
+    columns = ()                # Everything we keep besides the key
+    schema = ""                 # Column definitions for CREATE TABLE, key first
+    indexes = ()                # Columns to index
+    bool_columns = ()           # Columns sqlite hands back as 0/1
+
+    def __init__(self, path: Path, autocommit=True):
+        self.filename = str(path)
+        self.autocommit = autocommit
+        self._select = f'SELECT {self.key_column}, {", ".join(self.columns)} FROM "{self.tablename}"'
+        self._replace = f'REPLACE INTO "{self.tablename}" ({self.key_column}, {", ".join(self.columns)}) VALUES ({", ".join("?" * (len(self.columns) + 1))})'
+        self.conn = sqlite3.connect(self.filename, check_same_thread=False)   # Gets reused by open_table, which might be on another thread
+        self.conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        self.conn.execute("PRAGMA synchronous = OFF")                       # Same as the sqlitedict tables
+        for pragma, value in pragmas.items():
+            self.conn.execute(f"PRAGMA {pragma} = {value}")
+        self._create()
+
+    def _create(self) -> None:
+        '''
+        Creates the table if it isn't there, moving the rows over from the old sqlitedict table if there is one
+        '''
+        old_columns = [row[1] for row in self.conn.execute(f'PRAGMA table_info("{self.tablename}")')]
+        is_old = old_columns == ["key", "value"]
+        self.conn.execute("BEGIN")                                          # All or nothing
+        if is_old:
+            self.conn.execute(f'ALTER TABLE "{self.tablename}" RENAME TO "{self.tablename}_old"')
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.tablename}" ({self.schema}) WITHOUT ROWID')
+        for column in self.indexes:
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.tablename}_{column}" ON "{self.tablename}" ({column})')
+        if is_old:
+            rows = self.conn.execute(f'SELECT key, value FROM "{self.tablename}_old"').fetchall()
+            self.conn.executemany(self._replace, [self._to_row(key, decode(value)) for key, value in rows])
+            self.conn.execute(f'DROP TABLE "{self.tablename}_old"')
+            logging.info("Moved %s rows to the new %s table", len(rows), self.tablename)
+        self.conn.commit()
+
+    def _to_row(self, key: str, entry: dict) -> tuple:
+        return (key, *(entry.get(column) for column in self.columns))
+
+    def _to_dict(self, row: tuple) -> dict:
+        entry = {column: value for column, value in zip(self.columns, row[1:]) if value is not None}
+        for column in self.bool_columns:
+            if column in entry:
+                entry[column] = bool(entry[column])
+        return entry
+
+    def _changed(self) -> None:
+        if self.autocommit:
+            self.conn.commit()
+
+    def __getitem__(self, key: str) -> dict:
+        row = self.conn.execute(f"{self._select} WHERE {self.key_column} = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._to_dict(row)
+
+    def __setitem__(self, key: str, entry: dict) -> None:
+        self.update({key: entry})
+
+    def __delitem__(self, key: str) -> None:
+        if not self.conn.execute(f'DELETE FROM "{self.tablename}" WHERE {self.key_column} = ?', (key,)).rowcount:
+            raise KeyError(key)
+        self._changed()
+
+    def __contains__(self, key: str) -> bool:
+        return self.conn.execute(f'SELECT 1 FROM "{self.tablename}" WHERE {self.key_column} = ?', (key,)).fetchone() is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return self.conn.execute(f'SELECT COUNT(*) FROM "{self.tablename}"').fetchone()[0]
+
+    def get(self, key: str, default=None) -> dict:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> list[str]:
+        return [row[0] for row in self.conn.execute(f'SELECT {self.key_column} FROM "{self.tablename}"')]
+
+    def items(self) -> list[tuple[str, dict]]:
+        return [(row[0], self._to_dict(row)) for row in self.conn.execute(self._select)]
+
+    def by_parent(self, parent: str) -> dict:
+        '''
+        Returns all the rows for one parent as {key: entry}, this uses the index on parent
+        '''
+        return {row[0]: self._to_dict(row) for row in self.conn.execute(f"{self._select} WHERE parent = ?", (parent,))}
+
+    def update(self, entries: dict) -> None:
+        self.conn.executemany(self._replace, [self._to_row(key, entries[key]) for key in entries])
+        self._changed()
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+class FilesTable(ColumnTable):
+    '''
+    Every file we know about, found by its parent single when syncing
+    '''
+    tablename = "files"
+    key_column = "filepath"
+    columns = file_columns
+    schema = '''filepath TEXT PRIMARY KEY, parent TEXT, type TEXT, language TEXT, resolution TEXT,
+        bitrate TEXT, filesize INTEGER, length INTEGER, name TEXT, url TEXT, downloaded INTEGER'''
+    indexes = ("parent",)
+    bool_columns = ("downloaded",)
+
+class PathsTable(ColumnTable):
+    '''
+    Every path in the filetree, checked for collisions whenever something gets added
+    '''
+    tablename = "paths"
+    key_column = "path"
+    columns = path_columns
+    schema = "path TEXT PRIMARY KEY, parent TEXT, size INTEGER"
+    indexes = ("parent",)
+
+    def add_sizes(self, sizes: dict) -> None:
+        '''
+        Adds to the size of each path {path: bytes}, one UPDATE per path instead of a read and write per file
+        '''
+        self.conn.executemany('UPDATE "paths" SET size = COALESCE(size, 0) + ? WHERE path = ?', [(size, path) for path, size in sizes.items()])
+        self._changed()
+
+class VidInfoTable(ColumnTable):
+    '''
+    Player responses saved by sync, the expiry is a column so old ones can be thrown out without reading them
+    '''
+    tablename = "vid_info"
+    key_column = "url"
+    columns = vid_info_columns
+    schema = "url TEXT PRIMARY KEY, expires REAL, js_url TEXT, data BLOB"
+    indexes = ("expires",)
+
+    def remove_expired(self, before: float) -> int:
+        '''
+        Deletes every row that expires before the given time and returns how many went
+        '''
+        count = self.conn.execute('DELETE FROM "vid_info" WHERE expires < ?', (before,)).rowcount
+        self._changed()
+        return count
+
+column_tables = {table.tablename: table for table in (FilesTable, PathsTable, VidInfoTable)}  # Tables that aren't sqlitedict
+
+def new_database(path: Path) -> Path:
+    '''
+    Creates the database file with all of its tables and returns the path if successful
+    Every table is keyed on a TEXT PRIMARY KEY, so looking up an id already uses an index
+    '''
+    try:
+        forget_tables(path)                     # Don't reuse tables from a database that used to be here
+        with open_tables(path, *valid_tables):  # Opening a table creates it if it isn't there
+            pass
+        return path
+    except Exception as e:
+        logging.exception("Could not create database %s due to %s", path, e)
+        return None
+
+class FileWriteBatch:
+    '''
+    Collects writes to a table and saves them together, one transaction instead of one per write
+    Setting the same id again before it's saved only writes it once
+    Saves every batch_size writes so a long sync doesn't lose much if it gets killed, and the rest when the block ends
+    with FileWriteBatch(files_table) as batch:
+        batch[filepath] = file
+    '''
+    def __init__(self, table, size: int = None):
+        self.table = table
+        self.size = size or batch_size
+        self.pending = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()                # Even if something broke, keep what finished
+        return False
+
+    def __setitem__(self, id: str, keys: dict) -> None:
+        self.pending[id] = keys
+        if len(self.pending) >= self.size:
+            self.flush()
+
+    def flush(self) -> int:
+        '''
+        Saves everything that's waiting and returns how many it saved
+        '''
+        count = set_entries(self.pending, self.table)
+        commit_table(self.table)
+        self.pending = dict()
+        return count
+
+def _file_id(path: Path) -> tuple:
+    '''
+    Returns something that identifies the file at path, or None if there isn't one
+    '''
+    try:
+        stat = os.stat(path)
+        return (stat.st_dev, stat.st_ino)
+    except OSError:
+        return None
 
 def open_table(path: Path, table_name: str, autocommit=True) -> SqliteDict:
     '''
     Returns a table from the database that matches the string
+    Tables stay open and get reused, so the connection and PRAGMAs are only set up once per process
+    sqlitedict runs every table through its own thread, so one handle is safe to share between threads
     '''
     if table_name in valid_tables:
-        return SqliteDict(path, tablename=table_name, autocommit=autocommit)
+        key = (str(path), table_name, autocommit)
+        if key in _tables:
+            table, file_id = _tables.pop(key)
+            if table.conn is not None and file_id == _file_id(path):   # Still open on the same file
+                _tables[key] = (table, file_id)
+                return table
+            table.close()                       # The file was deleted or replaced, so open it again
+        if table_name in column_tables:         # These are real tables
+            table = column_tables[table_name](path, autocommit=autocommit)
+        else:
+            table = SqliteDict(path, tablename=table_name, autocommit=autocommit, journal_mode=journal_mode)
+            for pragma, value in pragmas.items():   # These only last for the connection, so set them when it opens
+                table.conn.execute(f"PRAGMA {pragma} = {value}")
+        _tables[key] = (table, _file_id(path))
+        return table
     else:
-        logging.error(f"Invalid table {table_name} given")
+        logging.error("Invalid table %s given", table_name)
         return None
 
-def close_table(table: SqliteDict) -> bool:
+@contextmanager
+def open_tables(path: Path, *table_names: str, autocommit=True) -> dict:
     '''
-    Closes the table and returns if successful
+    Opens all the tables we need at once and yields them as {table_name: table}
+    The tables are committed when the block finishes, they stay open to be reused
+    Every sqlitedict table holds its own connection, so writing to several of them
+    without autocommit will lock the database. Write in bulk with update() instead
     '''
+    tables = dict()
     try:
-        table.close()
-        return True
-    except Exception as e:
-        logging.exception('Could not close table %s due to %s', table.tablename, e)
+        for table_name in dict.fromkeys(table_names):   # Only open each table once
+            if (table := open_table(path, table_name, autocommit=autocommit)) is None:
+                raise ValueError(f"Invalid table {table_name} given")
+            tables[table_name] = table
+        yield tables
+        for table in tables.values():                   # Commit once at the end
+            commit_table(table)
+    finally:
+        for table in tables.values():
+            close_table(table)
+
+def close_table(table: SqliteDict) -> bool:
+    '''
+    Done with the table for now, commits it and returns if successful
+    The handle stays open for the next open_table, close_all really closes it
+    '''
+    return commit_table(table)
+
+def forget_tables(path: Path) -> None:
+    '''
+    Really closes any open tables for the database at path
+    '''
+    for key in [key for key in _tables if key[0] == str(path)]:
+        table, _ = _tables.pop(key)
+        try:
+            table.close()
+        except Exception as e:
+            logging.exception('Could not close table %s due to %s', table.tablename, e)
+
+def close_all() -> None:
+    '''
+    Really closes every open table, this runs when the program exits
+    '''
+    for path in {key[0] for key in _tables}:
+        forget_tables(path)
+
+atexit.register(close_all)
 
 def commit_table(table: SqliteDict) -> bool:
     '''
@@ -89,6 +383,7 @@ def commit_table(table: SqliteDict) -> bool:
 def set_entry(id: str, keys: dict, table: SqliteDict) -> str:
     '''
     Sets an item in the given database table
+    For lots of writes (or the same id over and over) use a FileWriteBatch or set_entries instead
     '''
     try:
         table[id] = keys
@@ -96,16 +391,66 @@ def set_entry(id: str, keys: dict, table: SqliteDict) -> str:
     except Exception as e:
         logging.error("Could not add id %s to table %s", id, table.tablename)
 
+def set_entries(entries: dict, table: SqliteDict) -> int:
+    '''
+    Sets all the entries {id: keys} in the table in one go and returns how many were set
+    sqlitedict writes these with a single executemany + commit instead of one per entry
+    '''
+    try:
+        if entries:
+            table.update(entries)
+        return len(entries)
+    except Exception as e:
+        logging.exception("Could not add %s entries to table %s due to %s", len(entries), table.tablename, e)
+        return 0
+
+def add_path_sizes(sizes: dict, table: PathsTable) -> int:
+    '''
+    Grows the paths in the table by {path: bytes} and returns how many paths were given
+    '''
+    try:
+        if sizes:
+            table.add_sizes(sizes)
+        return len(sizes)
+    except Exception as e:
+        logging.exception("Could not add sizes for %s paths to table %s due to %s", len(sizes), table.tablename, e)
+        return 0
+
 def get_entry(id: str, table: SqliteDict) -> dict:
     '''
     If the id exists in the table, returns the matching entry as a dict
+    Every read unpickles a brand new dict, so there's no need to copy it
     '''
-    if id in table:
-        entry = deepcopy(table[id])
-        return entry
-    else:
+    try:
+        return table[id]        # One query instead of checking first
+    except KeyError:
         logging.error("Could not find entry for %s in table %s", id, table.tablename)
 
+def list_all(path: Path) -> list[tuple[str, str, str]]:
+    '''
+    Returns (type, name, url) for everything in the mirror, reading all the tables in one query
+    Singles that belong to a channel or playlist are left out, they show up under their parent
+    Tables that were never made (older or singles-only mirrors) are skipped
+    Sorted by type and then url, rowids change every time sqlitedict rewrites an entry so they can't be used
+    '''
+    try:
+        with closing(sqlite3.connect(path)) as conn:
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            selects = [f'SELECT {i} AS i, \'{table_name}\', key, value FROM "{table_name}"' for i, table_name in enumerate(yt_tables) if table_name in existing]
+            if not selects:
+                return []
+            rows = conn.execute(" UNION ALL ".join(selects) + " ORDER BY i, key").fetchall()
+    except Exception as e:
+        logging.exception("Could not list the mirror in %s due to %s", path, e)
+        return []
+    items = list()
+    for _, yt_string, url, value in rows:
+        keys = decode(value)                # Values are stored the way sqlitedict stores them
+        if yt_string == "single" and keys.get("parent_type", "single") != "single":
+            continue
+        items.append((yt_string, keys["name"], url))
+    return items
+
 def remove_entry(id: str, table: SqliteDict) -> bool:
     '''
     Removes the entry from the table if it exists and returns if successful
@@ -118,6 +463,34 @@ def remove_entry(id: str, table: SqliteDict) -> bool:
         logging.exception("Could not remove %s from table %s due to %s", id, table.tablename, e)
         return False
 
+def remove_expired(before: float, table: VidInfoTable) -> int:
+    '''
+    Removes the saved player responses that expire before the given time and returns how many were removed
+    '''
+    try:
+        return table.remove_expired(before)
+    except Exception as e:
+        logging.exception("Could not remove expired entries from table %s due to %s", table.tablename, e)
+        return 0
+
+def remove_entries(ids, table: SqliteDict) -> int:
+    '''
+    Removes all the ids from the table in one go and returns how many were asked for
+    Deleting one at a time commits after every id, this commits once at the end
+    Ids that aren't in the table are just skipped
+    '''
+    try:
+        ids = [(id,) for id in ids]
+        if ids:
+            key_column = getattr(table, "key_column", "key")    # sqlitedict tables are all key/value
+            table.conn.executemany(f'DELETE FROM "{table.tablename}" WHERE {key_column} = ?', ids)
+            if table.autocommit:
+                table.commit()
+        return len(ids)
+    except Exception as e:
+        logging.exception("Could not remove %s entries from table %s due to %s", len(ids), table.tablename, e)
+        return 0
+
 
 # def add_yt(table: SqliteDict, filetree: SqliteDict, yt_string: str, id: str, keys: dict, ) -> None:
 #     '''
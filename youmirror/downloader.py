@@ -9,15 +9,56 @@ I could maybe make other types of downloads available. I think a possible one is
 
 '''
 from pytube import YouTube, Stream, Caption
+from pytube import request  # For streaming the bytes ourselves
+import youmirror.filer as filer    # For making directories
 import logging
-from pathlib import Path
+import os
 import subprocess
-from urllib.request import urlretrieve, urlopen  # Using this to download thumbnails
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed # For downloading several files at once
+from urllib.request import urlretrieve  # Using this to download thumbnails
+from urllib.parse import urlsplit
+import http.client
+import threading
+import queue
 
 file_types = {"video", "caption", "audio", "thumbnail"} # TODO download js and raw html?
 # Order resolutions from highest to lowest in a list
 resolutions = ["2160p", "1440p", "1080p", "720p", "480p", "360p", "240p", "144p"] # Stored as a list because order is important
+resolution_fallbacks = {res: tuple(resolutions[i:]) for i, res in enumerate(resolutions)}  # What to try for each resolution, highest first
 sub_types = ["mp4", "webm"]    # Prefer mp4 over webm
+filesizes = dict()  # Sizes we already asked youtube for {(video_id, file_type, resolution, has_ffmpeg): filesize}
+large_stream = 4 * 1024 * 1024  # Streams at least this big download and write to disk on separate threads
+chunk_queue_size = 16           # How many chunks can wait to be written
+http_timeout = 30   # Seconds before giving up on a connection
+http_headers = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}   # Same headers pytube sends
+_http = threading.local()   # Each thread keeps its own open connections {(scheme, host): connection}
+
+def http_request(method: str, url: str) -> http.client.HTTPResponse:
+    '''
+    Makes a request over a kept-alive connection for this thread, so repeat requests
+    to the same host (like i.ytimg.com for thumbnails) skip the TCP/TLS handshake
+    The response has to be read all the way before this thread makes another request
+    '''
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    if not hasattr(_http, "connections"):
+        _http.connections = dict()
+    connections = _http.connections
+    for attempt in range(2):                        # A kept-alive connection may have been closed on the other end, so retry once
+        connection = connections.get(key)
+        if connection is None:
+            conn_type = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            connection = connections[key] = conn_type(parts.netloc, timeout=http_timeout)
+        try:
+            connection.request(method, target, headers=http_headers)
+            return connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            connection.close()                      # Toss the broken connection
+            del connections[key]
+            if attempt:
+                raise
 
 def get_stream(yt: YouTube, file_type: str, options: dict) -> Stream:
     '''
@@ -40,16 +81,16 @@ def get_video_stream(yt: YouTube, options: dict) -> Stream:
             resolution = options["resolution"]  # Get the resolution from the options
         else:
             return yt.streams.filter(progressive=True, subtype="mp4").order_by("resolution").last()  # Else, get the highest res progressive stream (usually 720p)
-        stream = None       # Initialize the stream
-        find_res = iter(resolutions[resolutions.index(resolution):]) # Iterate through the resolutions
-        while not stream:   # Until we find a good one
-            streams = yt.streams.filter(subtype="mp4", resolution=resolution) # Filter streams by resolution
-            stream = next(iter(streams), None)  # Get the first stream or none if there is no stream
-            resolution = next(find_res) # Get the next resolution
+        by_res = dict()     # The first mp4 stream for each resolution, in one pass over the streams
+        for stream in yt.streams.filter(subtype="mp4"):
+            by_res.setdefault(stream.resolution, stream)
+        for res in resolution_fallbacks[resolution]:    # Go down from the resolution they asked for
+            if res in by_res:
+                return by_res[res]
+        logging.error("Could not find a video stream at or below %s", resolution)
     except KeyError:
         logging.exception("Could not find stream")
-        return None
-    return stream
+    return None
 
 def get_audio_stream(yt: YouTube, options: dict) -> Stream:
     '''
@@ -66,15 +107,55 @@ def combine_video_audio(video_file: str, audio_file: str) -> str:
     '''
     Combines the video and audio files
     '''
-    temp = Path(f'{video_file}.temp')   # Create temp file
-    temp.touch()                        # Create the file   
-    Path(video_file).rename(temp)       # Rename the video file to the temp file
-    temp = str(temp)                    # Convert to string
-    subprocess.run(["ffmpeg", "-y", "-i", f"{temp}", "-i", f"{audio_file}", "-c:v", "copy", "-c:a", "copy", f"{video_file}"], capture_output=True)               # Use ffmpeg to combine the video and audio
-    Path(audio_file).unlink()     # Delete the temp audio file
-    Path(temp).unlink()           # Delete the temp video file
+    temp = f'{video_file}.temp'         # Temp file name
+    os.replace(video_file, temp)        # Rename the video file to the temp file
+    subprocess.run(["ffmpeg", "-y", "-i", temp, "-i", audio_file, "-c:v", "copy", "-c:a", "copy", video_file], capture_output=True)               # Use ffmpeg to combine the video and audio
+    os.remove(audio_file)         # Delete the temp audio file
+    os.remove(temp)               # Delete the temp video file
     return video_file
 
+def mux_streams(video_stream: Stream, audio_stream: Stream, video_file: str) -> bool:
+    '''
+    Streams the video and audio straight into ffmpeg over pipes, so neither one has to be
+    written to disk and read back before combining. Returns if it worked
+    The video goes in on stdin and the audio on an extra pipe, windows can't pass that so it's posix only
+    '''
+    if os.name != "posix":
+        return False
+    audio_read, audio_write = os.pipe()         # ffmpeg reads the audio from its own copy of this fd
+    try:
+        process = subprocess.Popen(["ffmpeg", "-y", "-i", "pipe:0", "-i", f"pipe:{audio_read}", "-c:v", "copy", "-c:a", "copy", "-f", "mp4", video_file],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, pass_fds=(audio_read,))
+    except Exception:
+        os.close(audio_write)
+        logging.exception("Could not start ffmpeg")
+        return False
+    finally:
+        os.close(audio_read)                    # The child has it now
+    failed = list()                             # Writers that didn't make it to the end
+
+    def feed(stream: Stream, pipe) -> None:
+        try:
+            with pipe:
+                for chunk in request.stream(stream.url):
+                    pipe.write(chunk)
+        except Exception:                       # ffmpeg quit early or the download broke
+            logging.debug("Could not stream %s into ffmpeg", stream, exc_info=True)
+            failed.append(stream)
+
+    # Both have to be fed at once, ffmpeg reads a bit of each as it goes
+    writers = [threading.Thread(target=feed, args=(video_stream, process.stdin)), threading.Thread(target=feed, args=(audio_stream, open(audio_write, "wb")))]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    if process.wait() != 0 or failed:
+        logging.error("Could not combine streams into %s", video_file)
+        if os.path.exists(video_file):
+            os.remove(video_file)               # Don't leave half a video behind
+        return False
+    return True
+
 def calculate_video_filesize(yt: YouTube, options: dict) -> int:
     '''
     Calculates the size of a video file
@@ -106,30 +187,94 @@ def calculate_thumbnail_filesize(yt: YouTube, options: dict):
     '''
     Calculates the size of a thumbnail file
     '''
-    url = yt.thumbnail_url          # Get the thumbnail url
-    file = urlopen(url)    # Use pytube's request module to get the filesize
-    return file.length
+    url = yt.thumbnail_url              # Get the thumbnail url
+    response = http_request("HEAD", url)    # Only need the headers, not the image
+    response.read()                     # Finish the response so the connection can be reused
+    if response.status != 200:
+        return 0
+    return int(response.getheader("Content-Length", 0))
 
+filesize_funcs = {"video": calculate_video_filesize, "audio": calculate_audio_filesize, "caption": calculate_caption_filesize, "thumbnail": calculate_thumbnail_filesize} # Translation from file type to size func
 
 def calculate_filesize(yt: YouTube, file_type: str, options: dict) -> int:
     '''
     Gets the size of the file type 
     '''
     try:
-        file_type_to_func = {"video": calculate_video_filesize, "audio": calculate_audio_filesize, "caption": calculate_caption_filesize, "thumbnail": calculate_thumbnail_filesize}
-        func = file_type_to_func[file_type]
+        key = (yt.video_id, file_type, options.get("resolution"), options.get("has_ffmpeg"))
+        if key in filesizes:                # Don't ask youtube twice
+            return filesizes[key]
+        func = filesize_funcs[file_type]
         filesize = func(yt, options)
     except:
         logging.exception("Could not calculate filesize")
         return 0
+    if filesize:                            # Only remember the ones that worked
+        filesizes[key] = filesize
     return filesize
 
+def calculate_filesizes(items: list, options: dict, max_workers: int = 16) -> list[int]:
+    '''
+    Calculates the sizes for a list of (yt, file_type) at once and returns them in the same order
+    Each one is a round trip to youtube, so they are done in threads
+    Items for the same pytube object share its streams, so each video's sizes are worked out on one thread
+    '''
+    if not items:
+        return []
+    videos = dict()             # {id(yt): [index, ...]}, where each video's items are
+    for index, (yt, _) in enumerate(items):
+        videos.setdefault(id(yt), []).append(index)
+    def video_sizes(indexes: list) -> list[int]:
+        return [calculate_filesize(items[index][0], items[index][1], options) for index in indexes]
+    sizes = [0] * len(items)   # Not filesizes, that's the cache calculate_filesize uses
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(videos)))) as executor:
+        for indexes, found in zip(videos.values(), executor.map(video_sizes, videos.values())):
+            for index, size in zip(indexes, found):
+                sizes[index] = size
+    return sizes
+
 def download_stream(stream: Stream, path: str, filename: str, options: dict) -> bool:
     '''
     Downloads to the given filepath and returns if a new file was downloaded or not
     TODO would be nice if the download only wrote to file on complete (maybe suggest to pytube)
     '''
-    stream.download(output_path=path, filename=filename) # Download to the appropriate path and name
+    if stream.filesize < large_stream:                      # Not worth the threads
+        stream.download(output_path=path, filename=filename) # Download to the appropriate path and name
+        return True
+    filepath = os.path.join(path, filename)
+    if stream.exists_at_path(filepath):                     # Same as pytube, skip it if it's already all there
+        return True
+    filer.create_path(path)
+    chunks = queue.Queue(maxsize=chunk_queue_size)          # Bounded so a slow disk doesn't pile up the whole video in memory
+    stop = threading.Event()                                # Tells the fetcher to quit if writing fails
+    errors = list()
+
+    def fetch() -> None:
+        try:
+            for chunk in request.stream(stream.url):
+                if stop.is_set():
+                    break
+                chunks.put(chunk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunks.put(None)                                # Tell the writer we're done
+
+    fetcher = threading.Thread(target=fetch, daemon=True)  # Network on this thread, disk on ours
+    fetcher.start()
+    try:
+        with open(filepath, "wb") as f:
+            while (chunk := chunks.get()) is not None:
+                f.write(chunk)
+    finally:
+        stop.set()
+        while fetcher.is_alive():                           # Unblock the fetcher if we stopped early
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    if errors:
+        raise errors[0]
     return True
 
 def download_video(yt: YouTube, path: str, filename: str, options: dict) -> dict:
@@ -141,19 +286,23 @@ def download_video(yt: YouTube, path: str, filename: str, options: dict) -> dict
         length = yt.length
         filesize = video_stream.filesize                            # Get the filesize
         bitrate = video_stream.abr                                  # Get the bitrate
-        download_stream(video_stream, path, filename, options)      # Download the video stream
-        if not video_stream.includes_audio_track:                   # If no audio track
-            filepath = str(Path(path)/Path(filename))               # Get the filepath
+        if video_stream.includes_audio_track:                       # Progressive streams are already done
+            download_stream(video_stream, path, filename, options)  # Download the video stream
+        else:                                                       # If no audio track
+            filepath = os.path.join(path, filename)                 # Get the filepath
             audio_stream = get_audio_stream(yt, options)            # Get the audio stream
             filesize += audio_stream.filesize                       # Add the filesize
             bitrate = audio_stream.abr                              # Get the bitrate
-            download_stream(audio_stream, path, "temp_audio.mp4", options)  # Download the audio stream
-            audio_filepath = str(Path(path)/Path("temp_audio.mp4")) # Get the audio filepath
-            combine_video_audio(filepath, audio_filepath) # Combine the video and audio
+            filer.create_path(path)                                    # ffmpeg won't make the directory
+            if not mux_streams(video_stream, audio_stream, filepath):   # Try combining them on the fly first
+                download_stream(video_stream, path, filename, options)  # Else download both and combine them after
+                download_stream(audio_stream, path, "temp_audio.mp4", options)  # Download the audio stream
+                audio_filepath = os.path.join(path, "temp_audio.mp4")   # Get the audio filepath
+                combine_video_audio(filepath, audio_filepath) # Combine the video and audio
         specs = {"resolution": video_stream.resolution, "bitrate": bitrate, "filesize": filesize, "length": length, "downloaded": True}
         return specs
     except Exception as e:
-        logging.exception(f'Could not download video {filename}')
+        logging.exception('Could not download video %s', filename)
         return None
 
 def download_caption(yt: YouTube, path: str, filename: str, options: dict) -> dict:
@@ -174,7 +323,7 @@ def download_caption(yt: YouTube, path: str, filename: str, options: dict) -> di
         print("Could not find caption for language: " + caption_type)
         return None
     except Exception as e:
-        logging.exception(f'Could not download caption {filename}')
+        logging.exception('Could not download caption %s', filename)
         return None
 
 def download_audio(yt: YouTube, path: str, filename: str, options: dict) -> str:
@@ -194,7 +343,7 @@ def download_audio(yt: YouTube, path: str, filename: str, options: dict) -> str:
             # subprocess.run(["ffmpeg", "-y", "-i", f"{path}{filename}", "-ss", "00:00:00", "-t", f"{length}", f"{path}{filename}"])
         return specs
     except Exception as e:
-        logging.exception(f'Could not download audio {filename}')
+        logging.exception('Could not download audio %s', filename)
         return None
 
 
@@ -203,34 +352,71 @@ def download_thumbnail(yt: YouTube, path: str, filename: str, options: dict) ->
     Gets the thumbnail from the video and downloads it
     '''
     try:
-        path = Path(path)                       # Wrap the path
-        path.mkdir(parents=True, exist_ok=True) # Create the directory if it doesn't exist
-        filepath = path/Path(filename)  # Build the filepath
-        filepath.touch()                # Create the file
+        filer.create_path(path)                 # Create the directory if it doesn't exist
+        filepath = os.path.join(path, filename) # Build the filepath
         url = yt.thumbnail_url          # For now, pytube can only get the url for a thumbnail
-        urlretrieve(url, filepath)      # Download the thumbnail
-        specs = {"url": url, "downloaded": True} # TODO figure out the filesize
+        response = http_request("GET", url)     # Reuse this thread's connection to the thumbnail host
+        if response.status == 200:
+            with open(filepath, "wb") as f:
+                shutil.copyfileobj(response, f) # Stream it straight to the file
+                filesize = f.tell()
+        else:                           # Redirects and such, let urllib handle it
+            response.read()             # Finish the response so the connection can be reused
+            urlretrieve(url, filepath)  # Download the thumbnail
+            filesize = os.path.getsize(filepath)
+        specs = {"url": url, "filesize": filesize, "downloaded": True}
         return specs
     except Exception as e:
-        logging.exception(f'Could not download thumbnail at {filepath}')
+        logging.exception('Could not download thumbnail at %s', filepath)
         return None
 
-def download_single(yt: YouTube, file_type: str, filepath: str, options: dict) -> dict:
+download_funcs = {          # Translation from file type to func
+    "video": download_video, 
+    "audio": download_audio, 
+    "caption": download_caption, 
+    "thumbnail": download_thumbnail}
+
+def download_single(yt: YouTube, file_type: str, filepath: str, options: dict, path: str = None) -> dict:
     '''
     Takes a single YouTube object and handles the downloading based on configs
+    Pass the directory if it's already known, so it doesn't get worked out again for every file
     '''
-
-    file_type_to_do = {         # Translation from file type to func
-        "video": download_video, 
-        "audio": download_audio, 
-        "caption": download_caption, 
-        "thumbnail": download_thumbnail}
-
     try:
-        path = str(Path(filepath).parent)    # Extract the path
-        filename = str(Path(filepath).name)  # Extract the filename
-        func = file_type_to_do[file_type]    # Figure out what to do
+        if path is None:
+            path, filename = os.path.split(filepath)    # Split off the filename in one go
+        else:
+            filename = os.path.basename(filepath)       # Only need the name then
+        path = path or "."                          # Path would have given us this for a bare filename
+        func = download_funcs[file_type]     # Figure out what to do
         return func(yt, path, filename, options)    # Call the function
     except Exception as e:
-        logging.exception(f'Could not download {file_type} {filepath}')
-        return None
\ No newline at end of file
+        logging.exception('Could not download %s %s', file_type, filepath)
+        return None
+
+def download_many(jobs: list, max_workers: int = 8):
+    '''
+    Downloads several files at once, downloads are mostly waiting on the network so threads work fine
+    jobs = [(key, yt, file_type, filepath, options, path), ...], path is the directory of filepath (or None)
+    Yields (key, specs) as each download finishes, specs is None if the download failed
+    The files of one video share a pytube object, and pytube fills in its streams without a lock,
+    so each video's files are downloaded in order on one thread and different videos run at once
+    Closing the generator early waits for the videos already downloading and drops the rest
+    '''
+    if not jobs:
+        return
+    videos = dict()             # {id(yt): [job, ...]}, the jobs for each pytube object
+    for job in jobs:
+        videos.setdefault(id(job[1]), []).append(job)
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(videos))))
+    try:
+        futures = [executor.submit(download_video_jobs, video_jobs) for video_jobs in videos.values()]
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:    # If we're stopped early (ctrl-c or the caller broke off), don't start the videos still waiting
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def download_video_jobs(jobs: list) -> list:
+    '''
+    Downloads the files of one video one after another and returns [(key, specs), ...]
+    '''
+    return [(key, download_single(yt, file_type, filepath, options, path)) for key, yt, file_type, filepath, options, path in jobs]
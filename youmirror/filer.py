@@ -22,72 +22,129 @@ This is what the filetree looks like:
 ----
 '''
 from pathlib import Path
-from pytube.helpers import safe_filename
 import logging
+import os
+from typing import Union, Iterable
+from functools import lru_cache
 
 valid_file_types = {"video", "caption", "audio", "thumbnail"}  # Valid file types
+yt_folders = {"channel": "channels", "playlist": "playlists", "single": "singles"}   # Top folder for each yt string, also what makes a yt string valid
+file_type_to_suffix = {"video": ".mp4", "caption": ".srt", "audio": "_audio.mp4", "thumbnail": ".jpg"}  # What goes after the name, audio gets "_audio" so it doesn't clash with the video
+unsafe_characters = str.maketrans({**{chr(i): None for i in range(31)}, **{c: None for c in '"#$%\'*,./:;<>?\\^|~'}, " ": "_"})  # Same characters pytube's safe_filename strips, plus spaces to underscores
+max_name_length = 255       # Longest name safe_name gives back, like safe_filename
+file_type_options = (("video", "dl_video"), ("audio", "dl_audio"), ("caption", "dl_captions"), ("thumbnail", "dl_thumbnail"))  # Which option turns on each file type
+_dir_cache = dict()     # Names of the files in each directory we've listed, {parent: {names}}
+created_dirs = set()    # Directories we already made (or saw made), so we don't ask the filesystem again
 
-def file_exists(filepath: Path) -> bool:
+def list_files(parent: str) -> set:
+    '''
+    Returns the names of the files in a directory, listing it only once
+    '''
+    names = _dir_cache.get(parent)
+    if names is None:
+        try:
+            with os.scandir(parent) as entries:     # One listing instead of a stat per file
+                names = {entry.name for entry in entries if entry.is_file()}   # Uses the type readdir already gave us (only symlinks get a stat)
+        except FileNotFoundError:
+            names = set()                           # Nothing there yet
+        _dir_cache[parent] = names
+    return names
+
+def clear_dir_cache(path=None) -> None:
+    '''
+    Forgets the listing of one directory, or of all of them (and which ones we made) if no path is given
+    '''
+    if path is None:
+        _dir_cache.clear()
+        created_dirs.clear()
+    else:
+        _dir_cache.pop(str(path), None)
+
+def file_exists(filepath: Union[str, Path]) -> bool:
     '''
-    Checks if the config exists in the current working directory
+    Checks if the file exists, using the cached listing of its directory
     '''
     try:
-        return filepath.is_file()              # Check if the file exists
+        parent, name = os.path.split(os.fspath(filepath))
+        return name in list_files(parent or ".")    # Check if the file exists
     except Exception as e:
         logging.info(f"Could not check file {filepath} due to {e}")
         return False
 
-def create_file(filepath: Path) -> None:
+def create_file(filepath: Union[str, Path]) -> None:
     '''
     Creates a file given a path and filename
     '''
     try:
-        if not filepath.is_file():
-            filepath.open(mode = "w")
+        filepath = os.fspath(filepath)
+        if not os.path.isfile(filepath):
+            with open(filepath, mode = "w"):                # Just make it, nothing to write
+                pass
+        clear_dir_cache(os.path.dirname(filepath) or ".")   # The listing is out of date now
     except Exception as e:
         print(e)
 
-def create_path(path: Path) -> None:
+def create_path(path: Union[str, Path]) -> None:
     '''
-    Creates the path 
+    Creates the path unless we already did
     '''
     try:
-        if not path.is_dir():
-            path.mkdir(parents = True, exist_ok = True)     
+        path = os.fspath(path)
+        if path in created_dirs:
+            return
+        os.makedirs(path, exist_ok = True)              # exist_ok already covers it being there
+        clear_dir_cache(path)                           # Forget we saw it missing
+        while path and path not in created_dirs:        # Its parents are there too, so siblings skip the check
+            created_dirs.add(path)
+            path = os.path.dirname(path)
     except Exception as e:
         print(e)
 
+@lru_cache(maxsize=4096)    # Names repeat a lot (every file of a video, every path check)
+def safe_name(name: str) -> str:
+    '''
+    Sanitizes a name for the filetree and swaps spaces for underscores
+    Strips what pytube's safe_filename does, but in a single translate pass instead of a regex and a replace
+    '''
+    return name.translate(unsafe_characters)[:max_name_length]
+
+def parent_paths(filepath: str) -> list[str]:
+    '''
+    Returns every directory the file is inside of, closest first
+    "playlists/name/single/file.mp4" -> ["playlists/name/single", "playlists/name", "playlists"]
+    '''
+    parents = list()
+    path = os.path.dirname(filepath)
+    while path:
+        parents.append(path)
+        path = os.path.dirname(path)
+    return parents
+
 def calculate_path(yt_string: str, parent_name: str, single_name) -> str:
     '''
     Calculates 
     formula = /yt_strings/parent_name/single_name
     This is gonna be refactored cause I'm not using it the intended way in get_keys()
     '''
-    valid_yt_strings = {"channel" , "playlist", "single"}           # Valid yt strings
-    parent_name = safe_filename(parent_name).replace(' ', '_')                        # Sanitize the parent name (using pytube)
-    single_name = safe_filename(single_name).replace(' ', '_')                        # Sanitize the single name (using pytube)
-    if yt_string in valid_yt_strings:                               # Check the yt_string is valid
-        yt_string = yt_string + 's'                                 # Make plural for formatting reasons 
-        path = Path(yt_string)/Path(parent_name)/Path(single_name)  # Build the filepath
-        return str(path)
-    else:
-        logging.error(f"Invalid yt_string {yt_string} passed")
+    path = yt_folders.get(yt_string)                                # Checks the yt_string and gets its folder in one go
+    if path is None:
+        logging.error("Invalid yt_string %s passed", yt_string)
+        return None
+    if parent_name := safe_name(parent_name):                       # Sanitize the parent name, skip it if it's empty like Path did
+        path = path + os.sep + parent_name
+    if single_name := safe_name(single_name):                       # Sanitize the single name
+        path = path + os.sep + single_name
+    return path
 
 def calculate_filename(file_type: str, yt_name: str) -> str:
     '''
     Calculates the filename from the given database settings and returns a string
     '''
-        
-    file_type_to_extension = {"video": "mp4", "caption": "srt", "audio": "mp4", "thumbnail": "jpg"}
-    if file_type in valid_file_types:                       # Verify the file type is valid
-        filename = safe_filename(yt_name).replace(' ','_')  # Sanitize the filename
-        extension = file_type_to_extension[file_type]       # Convert the file type to an extension
-        if file_type == "audio":                            # If the file type is audio
-            filename = f'{filename}_audio'                      # Append "_audio" to the end of the filename
-        filename = f"{filename}.{extension}"                # Add the name and extension together
-        return filename
+    suffix = file_type_to_suffix.get(file_type)             # One lookup checks the type and gets the suffix
+    if suffix is not None:
+        return safe_name(yt_name) + suffix                  # Sanitize the filename and add the suffix
     else:
-        logging.error(f"Invalid file type {file_type} passed") 
+        logging.error("Invalid file type %s passed", file_type)
 
 def calculate_filepath(file_type: str, yt_string: str, parent_name: str,  single_name: str,) -> str:
     '''
@@ -95,56 +152,54 @@ def calculate_filepath(file_type: str, yt_string: str, parent_name: str,  single
     '''
     path = calculate_path(yt_string, parent_name, single_name)  # Get the path
     filename = calculate_filename(file_type, single_name)       # Get the filename
-    filepath = Path(path)/Path(filename)                    # Add them together
-    return str(filepath)
+    filepath = os.path.join(path, filename)                     # Add them together
+    return filepath
 
 # TODO
 def resolve_collision(path: str, filetree: dict, yt_id: str) -> str:
     '''
     Appends the yt_id if the path already exists
     '''
-    if path in filetree:                        # If the path already exists
-        logging.debug(f"Path {path} already exists")
-        suffix = str(Path(path).suffix)         # Get the suffix of the path
-        path = str(Path(path).with_suffix(''))  # Remove the suffix
-        path = f'{path}_{yt_id}{suffix}'        # Append "_ym{yt_id}" to the end of the name, reattach suffix 
-    return path
+    if path not in filetree:                    # Most paths don't collide
+        return path
+    logging.debug("Path %s already exists", path)
+    path, suffix = os.path.splitext(path)       # Take the suffix off the path
+    return f'{path}_{yt_id}{suffix}'            # Append "_{yt_id}" to the end of the name, reattach suffix
 
-def verify_installation(filepath: Path) -> bool:
+def verify_installation(filepath: Union[str, Path]) -> bool:
     '''
     Take a database entry and verify that it is fully installed
     '''
-    logging.info(f"Checking if file {filepath}")
-    if filepath.is_file():
-        logging.info(f"File {filepath} is installed")
-        return True
-    else:
-        logging.info(f"File {filepath} is not installed")
-    return False
+    return verify_installation_batch([filepath])[filepath]
+
+def verify_installation_batch(filepaths: Iterable[Union[str, Path]]) -> dict:
+    '''
+    Verifies a bunch of files at once and returns {filepath: installed}
+    Each directory is listed once with scandir, so this doesn't stat every file
+    '''
+    installed = dict()
+    for filepath in filepaths:
+        parent, name = os.path.split(os.fspath(filepath))
+        installed[filepath] = name in list_files(parent or ".")     # Listed the first time, remembered after
+        logging.info("File %s is %s", filepath, "installed" if installed[filepath] else "not installed")
+    return installed
 
 def get_files(path: str, yt_name: str, options: dict) -> dict:
     '''
     Returns a dict of filenames we want to download
     files = {filepath: {type: file_type, language: language}, filepath: {type: file_type, language: language}}
     '''
-    to_download = { # Returns true/false if we want to download the video
-        "video": options["dl_video"], 
-        "audio": options["dl_audio"], 
-        "caption": options["dl_captions"], 
-        "thumbnail": options["dl_thumbnail"]
-    }
     files = dict()
-    for file_type in to_download:
-        if to_download[file_type]:   # Check the boolean value matching the file_type
-            if file_type == "caption":
-                for language in options["captions"]:    # We can download multiple caption types
-                    filename = calculate_filename(file_type, f'{yt_name}_{language}')    # Add f'_{caption_type}'
-                    filepath = str(Path(path)/filename)
-                    files[filepath] = {"type": file_type, "language": language}  # Add to files               
-            else:
-                filename = calculate_filename(file_type, yt_name)    # Calculate the filename
-                filepath = str(Path(path)/filename)
-                files[filepath] = {"type": file_type}                            # Add to files
-
+    name = safe_name(yt_name)           # Every file but the captions shares this name
+    for file_type, option in file_type_options:
+        if not options[option]:         # Check if we want this file type
+            continue
+        suffix = file_type_to_suffix[file_type]
+        if file_type == "caption":
+            for language in options["captions"]:    # We can download multiple caption types
+                filepath = os.path.join(path, safe_name(f'{yt_name}_{language}') + suffix)   # Add f'_{caption_type}'
+                files[filepath] = {"type": file_type, "language": language}  # Add to files
+        else:
+            filepath = os.path.join(path, name + suffix)
+            files[filepath] = {"type": file_type}                            # Add to files
     return files
-
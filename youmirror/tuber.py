@@ -4,31 +4,70 @@ pulls information from pytube objects
 ---
 '''
 from pytube import YouTube, Channel, Playlist, extract
-from pytube.exceptions import RegexMatchError
+from pytube.exceptions import RegexMatchError, VideoUnavailable, MaxRetriesExceeded
+from http.client import HTTPException
 from typing import Union
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor   # Getting metadata is mostly waiting on youtube
 import logging
+import re
+import json
+import time
+import zlib
+from urllib.parse import urlsplit, parse_qs     # Stream urls say when they expire
+from copy import deepcopy
 
+class SavingYouTube(YouTube):
+    '''
+    A YouTube that keeps the player response as youtube sent it, so it can be saved for the next sync
+    pytube rewrites streamingData in place when it builds the streams, so it has to be copied right when it's fetched
+    It can also be offered a saved response (offer_vid_info), which it tries before asking youtube
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.raw_vid_info = None    # The untouched response, None if we didn't fetch it
+        self.fetched = None         # When we fetched it
+        self.saved_vid_info = None  # A packed response from the database to try first
+        self.used_saved = False
+
+    @property
+    def vid_info(self):
+        if not self._vid_info:
+            saved, self.saved_vid_info = self.saved_vid_info, None  # Only try it once
+            self.used_saved = bool(saved) and unpack_vid_info(self, saved)
+            if not self.used_saved:
+                self.fetched = time.time()
+                self.raw_vid_info = deepcopy(YouTube.vid_info.fget(self))
+        return self._vid_info
+
+    def bypass_age_gate(self):
+        super().bypass_age_gate()   # This fetches a new response too
+        self.fetched = time.time()
+        self.raw_vid_info = deepcopy(self._vid_info)
+
+max_workers = 32            # Most requests get_metadata_batch makes to youtube at once
+vid_info_margin = 3600      # Don't use a saved vid_info if its stream urls run out within this many seconds
+yt_string_to_func = {"channel": extract.channel_name, "playlist": extract.playlist_id, "single": extract.video_id}  # Translation dict from yt type to id function
+yt_string_to_type = {"channel": Channel, "playlist": Playlist, "single": SavingYouTube}    # Translation dict from yt type to pytube class
+link_regex = re.compile(r"/user/|/channel/|/c/|playlist\?list|watch\?v=")   # Everything link_type looks for in one scan
+link_markers = {"/user/": "channel", "/channel/": "channel", "/c/": "channel", "playlist?list": "playlist", "watch?v=": "single"}  # What each one means
+
+@lru_cache(maxsize=8192)    # The same urls get checked over and over
 def link_type(url: str) -> str:
     '''
     Really rough way to narrow down a link before creating a pytube object
     '''
-    channel_strings = {'/user/', '/channel/', '/c/'}        # Possible strings for a channel
-    if any(string in url for string in channel_strings):    # For some reason youtube has really inconsistent urls, so here we are
-        return "channel"
-    elif "playlist?list" in url:                            # String to check for a playlist
-        return "playlist"
-    elif "watch?v=" in url:                                 # String to check for a video
-        return "single"
+    if match := link_regex.search(url):     # For some reason youtube has really inconsistent urls, so here we are
+        return link_markers[match.group()]
     else:
-        logging.error(f"\'{url}\' is not a valid url")
+        logging.error("'%s' is not a valid url", url)
         return None
 
+@lru_cache(maxsize=4096)
 def link_id(url: str, yt_string = None) -> str:
     '''
     Uses pytube's extract module to get the id from a url (more lightweight than creating an object)
     '''
-    yt_string_to_func = {"channel": extract.channel_name, "playlist": extract.playlist_id, "single": extract.video_id}  # Translation dict from yt type to function
-
     if not yt_string:                   # Calculate the yt_string if not passed
         yt_string = link_type(url)
     func = yt_string_to_func[yt_string] # Extract the proper id from the url
@@ -37,46 +76,79 @@ def link_id(url: str, yt_string = None) -> str:
 def yt_to_type_string(yt: Union[Channel, Playlist, YouTube]) -> str:
     '''
     Gets the type of the given pytube object and returns a string
+    Channel is a kind of Playlist in pytube, so it has to be checked first
     '''
-    yt_type_to_string = {Channel: "channel", Playlist: "playlist", YouTube: "single"}    # Translation dict for convenience
-    yt_type = type(yt)                      # Get type of pytube object
-    if yt_type in yt_type_to_string:        # If it is a valid type
-        return yt_type_to_string[yt_type]   # Return the translated string
+    if isinstance(yt, YouTube):
+        return "single"
+    elif isinstance(yt, Channel):
+        return "channel"
+    elif isinstance(yt, Playlist):
+        return "playlist"
     else:
-        logging.error(f'Object {yt_type} is not a valid yt_type')
+        logging.error("Object %s is not a valid yt_type", type(yt))
 
 
 def get_metadata(yt: Union[Channel, Playlist, YouTube]) -> dict:
     '''
     Returns the metadata of a given pytube object as a dict
+    Works out the type once and reads everything from that branch
+    '''
+    if isinstance(yt, YouTube):
+        return {"name": yt.title, "id": yt.video_id, "available": is_available(yt)}   # Individual videos can be checked if they are available
+    elif isinstance(yt, Channel):           # Before Playlist, Channel is a Playlist
+        return {"name": yt.channel_name, "id": yt.channel_uri, "children": get_children(yt)}
+    elif isinstance(yt, Playlist):
+        return {"name": yt.title, "id": yt.playlist_id, "children": get_children(yt)}   # This will use pytube to get video_urls
+    else:
+        logging.error("Failed to get metadata for %s", yt)
+        return {"name": None, "id": None}
+
+def get_metadata_batch(yts: list, workers: int = None) -> list[dict]:
     '''
-    meta = dict()
-    meta["name"] = get_name(yt)             # Get the name
-    meta["id"] = get_id(yt)                 # Extract the id from the url
-    if type(yt) in [Channel, Playlist]:     # Check if we have a channel or playlist
-        children = get_children(yt)         # This will use pytube to get video_urls
-        meta["children"] = children         # Add the children urls to the metadata
-        meta["available"] = True            # We will add a check later to determine this
+    Gets the metadata for a bunch of pytube objects at once and returns it in the same order
+    Availability checks and children lists are each a round trip to youtube, so they are done in threads
+    Anything that fails (or is None) gets None instead of metadata
+    '''
+    if not yts:
+        return []
+    workers = min(workers or max_workers, len(yts))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_try_metadata, yts))
 
-    elif type(yt) == YouTube:
-        meta["available"] = is_available(yt)    # Individual videos can be checked if they are available
-    return meta
+def _try_metadata(yt: Union[Channel, Playlist, YouTube]) -> dict:
+    if yt is None:                  # Couldn't even make the object
+        return None
+    try:
+        return get_metadata(yt)
+    except Exception as e:
+        logging.exception("Could not get metadata for %s due to %s", yt, e)
+        return None
 
 def is_available(yt: YouTube) -> bool:
+    '''
+    Returns True if the video can be downloaded, False if youtube says it can't (private, removed, members only...)
+    Returns None if we couldn't tell because the connection failed, so it can be checked again later
+    Anything else is a bug (or pytube changed) and is raised, get_metadata_batch logs it and skips the video
+    '''
     try:
         yt.check_availability()
-    except Exception as e:
-        logging.exception(f"Video {yt.title} is not available due to {e}")   # Need to report the url or the title if we can
-    return True
+        return True
+    except VideoUnavailable as e:           # Youtube gave us an answer, no point asking again
+        logging.info("Video %s is not available due to %s", yt.watch_url, e)
+        return False
+    except (OSError, HTTPException, MaxRetriesExceeded) as e:   # Network trouble (URLError and timeouts are OSErrors)
+        logging.warning("Could not check if video %s is available due to %s", yt.watch_url, e)
+        return None
 
-def new_pytube(url: str) -> Union[YouTube, Channel, Playlist]:
+def new_pytube(url: str, url_type: str = None) -> Union[YouTube, Channel, Playlist]:
     '''
     This replaces get_pytube and returns a new pytube object from url
+    Pass the url_type if it's already known (like for children) to skip checking the url again
     '''
-    objects = {"channel": Channel, "playlist": Playlist, "single": YouTube}
-    url_type = link_type(url)                       # Returns what type of link it is (as string)
+    if not url_type:
+        url_type = link_type(url)                   # Returns what type of link it is (as string)
     try:
-        object = wrap_url(url, objects[url_type])   # Wrap the url in the proper pytube object
+        object = wrap_url(url, yt_string_to_type[url_type])   # Wrap the url in the proper pytube object
         return object
     except RegexMatchError:
         logging.error('Regex Error: could not find matching video for url %s', url)
@@ -95,49 +167,142 @@ def get_id(yt: Union[YouTube, Channel, Playlist]) -> str:
     """
     Returns the id of the pytube object
     """
-    type_to_id = {YouTube: "video_id", Channel: "channel_uri", Playlist: "playlist_id"}    # Translation dict from type to attribute
-    t = type(yt)
-    if t in type_to_id:
-        return getattr(yt, type_to_id[t])
+    if isinstance(yt, YouTube):
+        return yt.video_id
+    elif isinstance(yt, Channel):       # Before Playlist, Channel is a Playlist
+        return yt.channel_uri
+    elif isinstance(yt, Playlist):
+        return yt.playlist_id
     else:
-        logging.error(f"Failed to get id for {yt}")
+        logging.error("Failed to get id for %s", yt)
         return None
 
 def get_name(yt: Union[YouTube, Channel, Playlist]) -> str:
     """
     Returns the name of the pytube object
     """
-    type_to_name = {YouTube: "title", Channel: "channel_name", Playlist: "title"}    # Translation dict from type to attribute
-    t = type(yt)                         # Get the type of the object
-    if t in type_to_name:                # If it is a valid type
-        return getattr(yt, type_to_name[t])   # Return the attribute
+    if isinstance(yt, YouTube):
+        return yt.title
+    elif isinstance(yt, Channel):       # Before Playlist, Channel is a Playlist
+        return yt.channel_name
+    elif isinstance(yt, Playlist):
+        return yt.title
     else:
-        logging.error(f"Failed to get name for {yt}")
+        logging.error("Failed to get name for %s", yt)
         return None
 
 def get_url(yt: Union[YouTube, Channel, Playlist]) -> str:
     """
     Returns the url of the pytube object
     """
-    type_to_url = {YouTube: "watch_url", Channel: "vanity_url", Playlist: "playlist_url"}    # Translation dict from type to property
-    t = type(yt)                         # Get the type of the object
-    if t in type_to_url:                # If it is a valid type
-        return getattr(yt, type_to_url[t])   # Return the attribute
+    if isinstance(yt, YouTube):
+        return yt.watch_url
+    elif isinstance(yt, Channel):       # Before Playlist, Channel is a Playlist
+        return yt.vanity_url
+    elif isinstance(yt, Playlist):
+        return yt.playlist_url
     else:
-        logging.error(f"Failed to get url for {yt}")
+        logging.error("Failed to get url for %s", yt)
         return None
 
+def get_specs(yt: Union[YouTube, Channel, Playlist]) -> tuple[str, str, str]:
+    """
+    Returns the (id, name, url) of the pytube object in one go
+    """
+    if isinstance(yt, YouTube):
+        return yt.video_id, yt.title, yt.watch_url
+    elif isinstance(yt, Channel):       # Before Playlist, Channel is a Playlist
+        return yt.channel_uri, yt.channel_name, yt.vanity_url
+    elif isinstance(yt, Playlist):
+        return yt.playlist_id, yt.title, yt.playlist_url
+    else:
+        logging.error("Failed to get specs for %s", yt)
+        return None, None, None
+
 def get_children(yt: Union[Channel, Playlist]) -> list[str]:
     '''
     Takes either a Channel or Playlist object and returns its video links as a list of strings
     '''
     try:
-        if type(yt) in [Channel, Playlist]:
+        if isinstance(yt, Playlist):                    # Channels are Playlists too
             logging.debug(f"Getting children for {get_name(yt)}")
-            children = [url for url in yt.video_urls]   # Maybe we can async get this in the future?
-            return children
+            return list(yt.video_urls)                  # pytube hands them back unique and in order, just copy them
         else:
             return None
     except Exception as e:
         logging.exception(f"Failed to get children for {get_name(yt)} due to {e}")
-        return None
\ No newline at end of file
+        return None
+
+def get_children_batch(yts: list, workers: int = None) -> list[list[str]]:
+    '''
+    Gets the children of a bunch of channels and playlists at once and returns them in the same order
+    Each one pages through youtube on its own, so they're done in threads
+    pytube remembers the video urls on the object, so get_children on them afterwards doesn't ask again
+    '''
+    if not yts:
+        return []
+    workers = min(workers or max_workers, len(yts))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(get_children, yts))
+
+def url_expiry(vid_info: dict) -> float:
+    '''
+    Returns when the first stream url in the player response stops working (unix time), or None if they don't say
+    Youtube puts an "expire" parameter on every stream url, ciphered ones keep the url inside signatureCipher
+    '''
+    streaming_data = vid_info.get("streamingData", {})
+    for fmt in streaming_data.get("formats", []) + streaming_data.get("adaptiveFormats", []):
+        url = fmt.get("url") or parse_qs(fmt.get("signatureCipher", "")).get("url", [""])[0]
+        if expire := parse_qs(urlsplit(url).query).get("expire"):
+            return float(expire[0])
+    return None
+
+def pack_vid_info(yt: YouTube) -> dict:
+    '''
+    Returns the player response youtube sent for the video, compressed for saving along with the player js it goes with
+    Returns None if it wasn't fetched this time (not yet, or a saved one was used) or it has no streams in it
+    The expiry comes from the stream urls, if they don't have one it's counted from when the response was fetched
+    '''
+    vid_info = getattr(yt, "raw_vid_info", None)    # pytube rewrote the one it uses while building streams
+    if not vid_info or "streamingData" not in vid_info:
+        return None
+    expires = url_expiry(vid_info)
+    if expires is None:                             # The stream urls only work for a few hours
+        expires = yt.fetched + int(vid_info["streamingData"].get("expiresInSeconds", 0))
+    return {"expires": expires, "js_url": yt.js_url, "data": zlib.compress(json.dumps(vid_info).encode())}
+
+def vid_info_expired(packed: dict) -> bool:
+    '''
+    Returns if a saved player response is too close to running out to use
+    '''
+    return packed["expires"] < time.time() + vid_info_margin
+
+def offer_vid_info(yt: YouTube, packed: dict) -> bool:
+    '''
+    Hands the video a saved player response to use instead of asking youtube, returns if it was taken
+    It's only checked when pytube asks for the response, so the watch page it needs gets fetched on the download thread
+    '''
+    if not packed or not isinstance(yt, SavingYouTube) or yt._vid_info:   # Nowhere to put it or already have a fresh one
+        return False
+    yt.saved_vid_info = packed
+    return True
+
+def unpack_vid_info(yt: YouTube, packed: dict) -> bool:
+    '''
+    Gives pytube a saved player response so it doesn't ask youtube again, returns if it was used
+    Signatures in it can only be worked out with the player js it came with, so it isn't used once youtube moves to a new one
+    '''
+    if yt._vid_info:                                # Already have a fresh one
+        return False
+    if not packed or vid_info_expired(packed):      # Too close to running out
+        return False
+    if packed.get("js_url") != yt.js_url:           # The player changed
+        return False
+    yt._vid_info = json.loads(zlib.decompress(packed["data"]))
+    return True
+
+def used_saved_vid_info(yt: YouTube) -> bool:
+    '''
+    Returns if the video is running on a saved player response
+    '''
+    return getattr(yt, "used_saved", False)